@@ -0,0 +1,52 @@
+"""对冲请求：使用注入延迟的本地替身服务器（httpx.MockTransport），不访问网络"""
+
+import asyncio
+
+import httpx
+
+import update_cursor_links as ucl
+
+PLATFORM = "linux-x64"
+
+# 第一个请求在替身服务器中等待的时间（秒），对冲等待时间为其十分之一
+PRIMARY_DELAY = 0.5
+
+
+def run_hedged_request():
+    """发送一次带对冲的请求，返回 (下载URL, FetchStats, 第一个请求是否被取消)"""
+    requests_seen = 0
+    primary_cancelled = False
+
+    async def stand_in(request: httpx.Request) -> httpx.Response:
+        nonlocal requests_seen, primary_cancelled
+        requests_seen += 1
+        number = requests_seen
+        if number == 1:
+            try:
+                await asyncio.sleep(PRIMARY_DELAY)
+            except asyncio.CancelledError:
+                primary_cancelled = True
+                raise
+        # 用版本号的修订号标记是第几个请求返回的响应
+        download_url = (f"https://downloads.cursor.com/production/{'0' * 40}"
+                        f"/linux/x64/Cursor-1.0.{number}-x86_64.AppImage")
+        return httpx.Response(200, json={"downloadUrl": download_url})
+
+    async def run():
+        policy = ucl.HedgePolicy(enabled=True, fallback_delay=PRIMARY_DELAY / 10, min_delay=0.0)
+        async with ucl.CursorApiSession(base_url="http://stand-in.local", hedge_policy=policy,
+                                        transport=httpx.MockTransport(stand_in)) as session:
+            download_url = await ucl.hedged_request_download_url(PLATFORM, session)
+            return download_url, session.stats_for(PLATFORM)
+
+    download_url, stats = asyncio.run(run())
+    return download_url, stats, primary_cancelled
+
+
+def test_slow_request_is_hedged_and_cancelled():
+    download_url, stats, primary_cancelled = run_hedged_request()
+
+    assert stats.hedged == 1
+    # 第二个（对冲）请求胜出
+    assert ucl.extract_version(download_url) == "1.0.2"
+    assert primary_cancelled
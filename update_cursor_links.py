@@ -1,10 +1,26 @@
+import io
 import os
 import json
+import timeit
+import bisect
+import functools
+import hashlib
+import inspect
 import re
 import time
+import random
+import asyncio
 import logging
+import sqlite3
+import pstats
+import cProfile
+import tracemalloc
+import contextvars
+from contextlib import contextmanager
+from dataclasses import dataclass, field
 from datetime import datetime, timedelta, timezone
-from typing import Dict, List, Optional, Any, TypedDict
+from typing import Dict, List, Optional, Any, TypedDict, Iterator, Callable, Tuple, NamedTuple, Iterable, Union
+import uuid
 import httpx
 from pathlib import Path
 
@@ -19,6 +35,291 @@ logger = logging.getLogger("cursor_updater")
 # 禁用httpx的日志
 logging.getLogger("httpx").setLevel(logging.WARNING)
 
+# 当前所在的计时span，用于确定子span的父节点（在asyncio任务之间自动传递）
+_current_span: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("current_span", default=None)
+
+# 当前所在的内存统计帧，仅在tracemalloc启用时使用
+_memory_frame: contextvars.ContextVar[Optional[Dict[str, int]]] = contextvars.ContextVar("memory_frame", default=None)
+
+# 进入一个内存统计帧
+def enter_memory_frame() -> Tuple[Dict[str, int], contextvars.Token]:
+    """
+    开始统计一个阶段的内存峰值
+
+    tracemalloc只有一个全局峰值，进入子阶段前先把当前峰值记入父帧再重置，
+    退出时再把子阶段的峰值并入父帧，从而在嵌套阶段中得到各自的峰值。
+    """
+    current, peak = tracemalloc.get_traced_memory()
+    parent = _memory_frame.get()
+    if parent is not None:
+        parent["peak"] = max(parent["peak"], peak)
+    tracemalloc.reset_peak()
+    frame = {"start": current, "peak": current}
+    return frame, _memory_frame.set(frame)
+
+# 退出一个内存统计帧
+def exit_memory_frame(frame: Dict[str, int], token: contextvars.Token) -> int:
+    """结束一个阶段的内存统计，返回该阶段相对于开始时的峰值增量（字节）"""
+    frame["peak"] = max(frame["peak"], tracemalloc.get_traced_memory()[1])
+    _memory_frame.reset(token)
+    parent = _memory_frame.get()
+    if parent is not None:
+        parent["peak"] = max(parent["peak"], frame["peak"])
+    return frame["peak"] - frame["start"]
+
+class SpanTracer:
+    """
+    轻量级的分阶段计时
+
+    每个span结束时以JSON lines格式写入一行，包含名称、父span、开始时间、耗时和附加属性。
+    未配置输出文件时span不做任何事情，几乎没有开销。
+    """
+
+    def __init__(self) -> None:
+        self.trace_id: Optional[str] = None
+        self._file: Optional[Any] = None
+        # tracemalloc启用时记录每个阶段的内存峰值增量：(阶段名称, 字节数)
+        self.memory_phases: List[Tuple[str, int]] = []
+
+    @property
+    def enabled(self) -> bool:
+        return self._file is not None
+
+    def configure(self, path: Optional[Path]) -> None:
+        """
+        开始记录span，追加写入到指定文件
+
+        Args:
+            path: JSON lines输出文件，为None时关闭记录
+        """
+        self.close()
+        if path is None:
+            return
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = open(path, 'a', encoding='utf-8')
+        self.trace_id = uuid.uuid4().hex
+
+    def close(self) -> None:
+        """停止记录并关闭输出文件"""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    @contextmanager
+    def span(self, name: str, **attributes: Any) -> Iterator[Dict[str, Any]]:
+        """
+        记录一个阶段的耗时
+
+        Args:
+            name: 阶段名称
+            **attributes: 附加属性，执行过程中也可以向返回的字典中补充
+
+        Yields:
+            span的属性字典
+        """
+        trace_memory = tracemalloc.is_tracing()
+        if self._file is None and not trace_memory:
+            yield attributes
+            return
+
+        if trace_memory:
+            memory_frame, memory_token = enter_memory_frame()
+
+        span_id = uuid.uuid4().hex[:16]
+        parent_id = _current_span.get()
+        token = _current_span.set(span_id)
+        started_at = time.time()
+        started = time.perf_counter()
+        status = "ok"
+        try:
+            yield attributes
+        except BaseException:
+            status = "error"
+            raise
+        finally:
+            duration_ms = (time.perf_counter() - started) * 1000
+            _current_span.reset(token)
+            if trace_memory:
+                peak_growth = exit_memory_frame(memory_frame, memory_token)
+                attributes["memPeakKiB"] = round(peak_growth / 1024, 1)
+                self.memory_phases.append((name, peak_growth))
+            if self._file is not None:
+                record = {
+                    "trace": self.trace_id,
+                    "span": span_id,
+                    "parent": parent_id,
+                    "name": name,
+                    "start": round(started_at, 6),
+                    "durationMs": round(duration_ms, 3),
+                    "status": status,
+                    "attrs": attributes
+                }
+                self._file.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+
+# 在cProfile下运行
+def run_with_profile(func: Callable[[], Any], output_path: Path, top_n: int = 25) -> Any:
+    """
+    在cProfile下运行func，结束后（包括异常退出）写出pstats文件并输出耗时最多的函数
+
+    Args:
+        func: 要分析的函数
+        output_path: pstats输出文件，可用 python -m pstats 或 snakeviz 查看
+        top_n: 输出的函数数量
+
+    Returns:
+        func的返回值
+    """
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(func)
+    finally:
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        profiler.dump_stats(output_path)
+        summary = io.StringIO()
+        pstats.Stats(profiler, stream=summary).strip_dirs().sort_stats("cumulative").print_stats(top_n)
+        logger.info(f"性能分析结果已保存到 {output_path}，累计耗时最多的 {top_n} 个函数:\n{summary.getvalue()}")
+
+# 在tracemalloc下运行
+def run_with_memory_trace(func: Callable[[], Any], top_n: int = 15) -> Any:
+    """
+    在tracemalloc下运行func，结束后输出内存峰值、各阶段的峰值增量和分配最多的代码位置
+
+    临时对象（如保存历史时的JSON字符串、重建README时的整份文本）在结束前已释放，
+    它们的开销体现在各阶段的峰值增量中。
+
+    Args:
+        func: 要分析的函数
+        top_n: 输出的阶段和代码位置数量
+
+    Returns:
+        func的返回值
+    """
+    tracemalloc.start()
+    tracer.memory_phases.clear()
+    frame, token = enter_memory_frame()
+    try:
+        return func()
+    finally:
+        exit_memory_frame(frame, token)
+        snapshot = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+
+        lines = [f"内存峰值: {frame['peak'] / 1024:.1f} KiB"]
+        # 同名阶段（如每个平台的获取）取最大值
+        phase_peaks: Dict[str, int] = {}
+        for name, peak_growth in tracer.memory_phases:
+            phase_peaks[name] = max(phase_peaks.get(name, 0), peak_growth)
+        lines.append("各阶段峰值增量:")
+        for name, peak_growth in sorted(phase_peaks.items(), key=lambda x: x[1], reverse=True)[:top_n]:
+            lines.append(f"  {name:<20}{peak_growth / 1024:>10.1f} KiB")
+        lines.append("结束时仍存活的分配最多的代码位置:")
+        for stat in snapshot.statistics('lineno')[:top_n]:
+            lines.append(f"  {stat}")
+        logger.info('\n'.join(lines))
+
+# 全局计时器，main中按需启用
+tracer = SpanTracer()
+
+# 原子地写出运行状态文件
+def write_state_file(path: Path, text: str, description: str) -> bool:
+    """
+    先写入同目录下的临时文件再替换，读取方不会看到写了一半的文件；失败时只记录警告
+
+    Args:
+        path: 目标文件
+        text: 文件内容
+        description: 日志中使用的文件描述，如'下载API缓存'
+
+    Returns:
+        是否写入成功
+    """
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = Path(f"{path}.tmp")
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            f.write(text)
+        temp_path.replace(path)
+        return True
+    except Exception as error:
+        logger.warning(f'保存{description}失败: {error}')
+        return False
+
+class RunMetrics:
+    """
+    收集单次运行的指标，并在运行结束时写出OpenMetrics文本文件
+
+    输出文件可直接放到node-exporter的textfile目录中，用于在看板上观察请求延迟、
+    历史条目数和README大小的变化。
+    """
+
+    def __init__(self) -> None:
+        self.reset()
+
+    def reset(self) -> None:
+        """清空上一次运行的指标"""
+        self.run_duration_seconds: Optional[float] = None
+        self.run_success = False
+        self.new_version_found = False
+        self.history_entries: Optional[int] = None
+        self.readme_bytes_written = 0
+        self.rendered_row_hits = 0
+        self.rendered_row_misses = 0
+        self.fetches: Dict[str, Dict[str, Any]] = {}
+
+    def observe_fetch(self, platform: str, seconds: float, outcome: str, attempts: int) -> None:
+        """记录一个平台的获取延迟、结果和尝试次数"""
+        self.fetches[platform] = {"seconds": seconds, "outcome": outcome, "attempts": attempts}
+
+    def render(self) -> str:
+        """生成OpenMetrics文本格式"""
+        lines: List[str] = []
+
+        def metric(name: str, help_text: str, samples: List[tuple]) -> None:
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"# HELP {name} {help_text}")
+            for labels, value in samples:
+                label_text = ','.join(f'{key}="{val}"' for key, val in labels.items())
+                lines.append(f"{name}{{{label_text}}} {value}" if label_text else f"{name} {value}")
+
+        metric("cursor_updater_last_run_timestamp_seconds", "Unix time the run finished.",
+               [({}, f"{time.time():.3f}")])
+        metric("cursor_updater_run_success", "Whether the run finished without a fatal error.",
+               [({}, int(self.run_success))])
+        if self.run_duration_seconds is not None:
+            metric("cursor_updater_run_duration_seconds", "Wall time of the whole run.",
+                   [({}, f"{self.run_duration_seconds:.6f}")])
+        metric("cursor_updater_new_version_found", "Whether the run found and wrote a new version.",
+               [({}, int(self.new_version_found))])
+        if self.history_entries is not None:
+            metric("cursor_updater_history_entries", "Number of entries in the version history.",
+                   [({}, self.history_entries)])
+        metric("cursor_updater_readme_bytes_written", "Bytes written to README.md during the run.",
+               [({}, self.readme_bytes_written)])
+        metric("cursor_updater_rendered_rows", "README table rows served from the row cache or rendered.",
+               [({"result": "hit"}, self.rendered_row_hits), ({"result": "miss"}, self.rendered_row_misses)])
+        if self.fetches:
+            platforms = sorted(self.fetches)
+            metric("cursor_updater_fetch_latency_seconds", "Latency of the download URL lookup per platform.",
+                   [({"platform": p}, f"{self.fetches[p]['seconds']:.6f}") for p in platforms])
+            metric("cursor_updater_fetch_attempts", "Request attempts made per platform.",
+                   [({"platform": p}, self.fetches[p]["attempts"]) for p in platforms])
+            metric("cursor_updater_fetch_outcome", "Outcome of the download URL lookup per platform.",
+                   [({"platform": p, "outcome": self.fetches[p]["outcome"]}, 1) for p in platforms])
+        lines.append("# EOF")
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path: Path) -> None:
+        """
+        原子地写出指标文件，避免采集端读到写了一半的文件
+
+        Args:
+            path: 输出文件路径
+        """
+        write_state_file(path, self.render(), '指标文件')
+
+# 全局运行指标，main中重置并在结束时写出
+metrics = RunMetrics()
+
 # 获取东八区时间（UTC+8）
 def get_utc8_time() -> datetime:
     """返回东八区（UTC+8）的当前时间"""
@@ -61,6 +362,124 @@ PLATFORMS: Dict[str, PlatformInfo] = {
     }
 }
 
+# 并发获取平台下载链接时的默认最大并发数
+DEFAULT_FETCH_CONCURRENCY = 7
+
+# 探测模式下用于判断是否有新版本的平台（其下载URL中包含版本号）
+PROBE_PLATFORM = "linux-x64"
+
+class ParsedDownloadUrl(NamedTuple):
+    """从下载URL中解析出的信息，无法识别的字段为None"""
+
+    version: str  # 无法提取时为'Unknown'
+    commit: Optional[str]  # 构建对应的40位提交哈希
+    os: Optional[str]  # darwin / win32 / linux
+    arch: Optional[str]  # 路径中的架构，如 universal / x64 / arm64
+    kind: Optional[str]  # 安装包类型，如 dmg / system-setup / user-setup / appimage
+
+# 所有已知下载URL形式的预编译模式，一次匹配即可得到全部字段：
+#   .../production/<hash>/darwin/<arch>/Cursor-darwin-<arch>.dmg
+#   .../production/<hash>/win32/<arch>/system-setup/CursorSetup-<arch>-<version>.exe
+#   .../production/<hash>/win32/<arch>/user-setup/CursorUserSetup-<arch>-<version>.exe
+#   .../production/<hash>/linux/<arch>/Cursor-<version>-<x86_64|aarch64>.AppImage
+_DOWNLOAD_URL_PATTERN = re.compile(r"""
+    ^(?:[a-z]+://[^/]+)?
+    (?:/production/(?P<commit>[0-9a-f]{40}))?
+    (?:/(?P<os>darwin|win32|linux)/(?P<arch>[^/]+))?
+    (?:/(?P<setup>system-setup|user-setup))?
+    /(?:
+        Cursor(?:User)?Setup-[^-/]+-(?P<win_version>\d+(?:\.\d+)+)\.exe(?P<exe>)
+      | Cursor-(?P<linux_version>\d+(?:\.\d+)+)-[^-/]+\.AppImage(?P<appimage>)
+      | Cursor-darwin-[^/]+\.dmg(?P<dmg>)
+      | [^/?\#]*
+    )
+    (?:[?\#].*)?$
+""", re.VERBOSE)
+
+# 未知URL形式的兜底版本模式
+_GENERIC_VERSION_PATTERN = re.compile(r'[0-9]+\.[0-9]+\.[0-9]+')
+
+# 解析单个下载URL
+def parse_download_url(url: str) -> ParsedDownloadUrl:
+    """
+    从下载URL中一次性提取版本号、构建哈希、操作系统、架构和安装包类型
+
+    Args:
+        url: 下载链接URL
+
+    Returns:
+        解析结果；Mac的URL中不包含版本号，其version为'Unknown'
+    """
+    match = _DOWNLOAD_URL_PATTERN.match(url)
+    if not match:
+        version_match = _GENERIC_VERSION_PATTERN.search(url)
+        return ParsedDownloadUrl(version_match.group(0) if version_match else 'Unknown', None, None, None, None)
+
+    groups = match.groupdict()
+    version = groups["win_version"] or groups["linux_version"]
+    if groups["exe"] is not None:
+        kind = groups["setup"] or "exe"
+    elif groups["appimage"] is not None:
+        kind = "appimage"
+    elif groups["dmg"] is not None:
+        kind = "dmg"
+    else:
+        kind = None
+        version_match = _GENERIC_VERSION_PATTERN.search(url)
+        version = version_match.group(0) if version_match else None
+    return ParsedDownloadUrl(version or 'Unknown', groups["commit"], groups["os"], groups["arch"], kind)
+
+# 批量解析整个版本历史中的下载URL
+def parse_history_urls(history: "VersionHistory") -> Dict[str, Dict[str, ParsedDownloadUrl]]:
+    """
+    一次性解析版本历史中所有条目的下载URL
+
+    URL中不带版本号的平台（如Mac），会用同一构建哈希下其他平台解析出的版本号补全。
+
+    Args:
+        history: 版本历史对象
+
+    Returns:
+        版本号 -> 平台 -> 解析结果
+    """
+    parsed: Dict[str, Dict[str, ParsedDownloadUrl]] = {}
+    commit_versions: Dict[str, str] = {}
+    for entry in history["versions"]:
+        entry_parsed = {platform: parse_download_url(url) for platform, url in entry["platforms"].items()}
+        for result in entry_parsed.values():
+            if result.commit and result.version != 'Unknown':
+                commit_versions.setdefault(result.commit, result.version)
+        parsed[entry["version"]] = entry_parsed
+
+    for entry_parsed in parsed.values():
+        for platform, result in entry_parsed.items():
+            if result.version == 'Unknown' and result.commit in commit_versions:
+                entry_parsed[platform] = result._replace(version=commit_versions[result.commit])
+    return parsed
+
+# 下载URL解析器的微基准测试
+def benchmark_url_parser(history: "VersionHistory", repeat: int = 5) -> Dict[str, float]:
+    """
+    测量解析版本历史中每个URL的平均耗时
+
+    Args:
+        history: 用作样本的版本历史
+        repeat: 重复次数，取最快的一次
+
+    Returns:
+        URL数量以及单个URL和批量解析的平均耗时（纳秒/URL）
+    """
+    urls = [url for entry in history["versions"] for url in entry["platforms"].values()]
+    if not urls:
+        return {"urls": 0, "parse_ns_per_url": 0.0, "batch_ns_per_url": 0.0}
+    single = min(timeit.repeat(lambda: [parse_download_url(url) for url in urls], number=1, repeat=repeat))
+    batch = min(timeit.repeat(lambda: parse_history_urls(history), number=1, repeat=repeat))
+    return {
+        "urls": len(urls),
+        "parse_ns_per_url": single / len(urls) * 1e9,
+        "batch_ns_per_url": batch / len(urls) * 1e9
+    }
+
 # 从URL或文件名中提取版本号
 def extract_version(url: str) -> str:
     """
@@ -72,142 +491,1726 @@ def extract_version(url: str) -> str:
     Returns:
         提取的版本号，如果无法提取则返回'Unknown'
     """
-    # 对于Windows
-    win_match = re.search(r'CursorUserSetup-[^-]+-([0-9.]+)\.exe', url)
-    if win_match and win_match.group(1):
-        return win_match.group(1)
-
-    # 对于其他URL，尝试查找版本模式
-    version_match = re.search(r'[0-9]+\.[0-9]+\.[0-9]+', url)
-    return version_match.group(0) if version_match else 'Unknown'
+    return parse_download_url(url).version
 
 # 格式化日期为YYYY-MM-DD
 def format_date(date: datetime) -> str:
     """将日期对象格式化为YYYY-MM-DD格式的字符串"""
     return date.strftime('%Y-%m-%d')
 
+# 语义版本号格式：主版本号.次版本号.修订号[-预发布标识][+构建元数据]，允许 'v' 前缀
+_VERSION_PATTERN = re.compile(r'^v?(\d+(?:\.\d+)*)(?:-([0-9A-Za-z.-]+))?(?:\+([0-9A-Za-z.-]+))?$')
+
+@functools.total_ordering
+class Version:
+    """
+    解析后的版本号
+
+    比较用的key在解析时一次性计算，之后的比较和排序只做元组比较。
+    排序规则遵循语义版本：数字部分按数值比较，预发布版本低于正式版本，构建元数据不参与比较；
+    无法解析的版本（如'Unknown'）排在所有有效版本之前。
+    """
+
+    __slots__ = ("text", "release", "prerelease", "build", "key")
+
+    def __init__(self, text: str) -> None:
+        self.text = text
+        match = _VERSION_PATTERN.match(text.strip())
+        if not match:
+            self.release: Tuple[int, ...] = ()
+            self.prerelease: Tuple[str, ...] = ()
+            self.build: Optional[str] = None
+            self.key: Tuple[Any, ...] = (0, (), (0, (1, 0, text)))
+            return
+
+        release = tuple(int(part) for part in match.group(1).split('.'))
+        # 补齐到至少三段，使 '1.6' 与 '1.6.0' 相等
+        self.release = release + (0,) * (3 - len(release))
+        self.prerelease = tuple(match.group(2).split('.')) if match.group(2) else ()
+        self.build = match.group(3)
+
+        if self.prerelease:
+            # 数字标识符低于字母数字标识符，同类之间分别按数值或字典序比较
+            identifiers = tuple((0, int(part), '') if part.isdigit() else (1, 0, part) for part in self.prerelease)
+            prerelease_key: Tuple[Any, ...] = (0,) + identifiers
+        else:
+            prerelease_key = (1,)
+        self.key = (1, self.release, prerelease_key)
+
+    @property
+    def is_valid(self) -> bool:
+        """是否为可解析的版本号"""
+        return self.key[0] == 1
+
+    @property
+    def sort_token(self) -> str:
+        """
+        与key排序一致的字符串，用于在数据库中按字典序索引和排序
+
+        数字补齐为固定宽度；'!'小于任何数字和标识符字符，用作各部分的结束标记，
+        '~'大于'#'，使正式版本排在同一release的预发布版本之后。
+        """
+        if not self.is_valid:
+            return f"0{self.text}"
+        parts = ["1"]
+        parts.extend(f"{number:012d}." for number in self.release)
+        parts.append("!")
+        if not self.prerelease:
+            parts.append("~")
+        else:
+            parts.append("#")
+            for identifier in self.prerelease:
+                parts.append(f"0{int(identifier):012d}." if identifier.isdigit() else f"1{identifier}!")
+            parts.append("!")
+        return "".join(parts)
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, Version):
+            return NotImplemented
+        return self.key == other.key
+
+    def __lt__(self, other: "Version") -> bool:
+        if not isinstance(other, Version):
+            return NotImplemented
+        return self.key < other.key
+
+    def __hash__(self) -> int:
+        return hash(self.key)
+
+    def __str__(self) -> str:
+        return self.text
+
+    def __repr__(self) -> str:
+        return f"Version({self.text!r})"
+
+# 解析版本号（按字符串缓存）
+@functools.lru_cache(maxsize=1 << 16)
+def parse_version(version_str: str) -> Version:
+    """
+    将版本字符串解析为Version，同一字符串只解析一次
+
+    Args:
+        version_str: 版本字符串，如 '1.6.14'、'v1.6.14' 或 '2.0.0-beta.1'
+
+    Returns:
+        可直接比较的Version对象
+    """
+    return Version(version_str)
+
 # 版本排序辅助函数
-def version_key(version_str: str) -> List[Any]:
+def version_key(version_str: str) -> Tuple[Any, ...]:
     """将版本字符串转换为可比较的元组，用于正确的语义版本排序
-    
+
     Args:
         version_str: 版本字符串，如 '1.6.14' 或 'v1.6.14'
-        
+
     Returns:
-        可比较的列表，包含整数和字符串部分
+        可比较的元组，同一字符串的结果会被缓存
+    """
+    return parse_version(version_str).key
+
+# README表格中展示的最近版本数，更早的版本见 docs/history/ 中各系列的页面
+README_TABLE_ROWS = 20
+
+class HistoryIndex:
+    """
+    带哈希索引、始终保持有序的版本历史容器
+
+    维护 版本号 -> 条目 的哈希索引，查找和去重对每个条目都是O(1)。
+    条目和预先计算好的排序key按版本升序保存在两个平行列表中，新版本通过二分查找插入，
+    每次插入只需O(log n)次比较加一次列表插入，不再需要每次运行都对整个历史重新排序。
+    迭代和导出时按最新的在前的顺序输出。
+    """
+
+    def __init__(self, entries: Iterable["VersionHistoryEntry"] = ()) -> None:
+        """
+        Args:
+            entries: 初始条目（任意顺序），重复的版本只保留第一次出现的条目
+        """
+        self._entries: List[VersionHistoryEntry] = []
+        self._keys: List[Tuple[Any, ...]] = []
+        self._by_version: Dict[str, VersionHistoryEntry] = {}
+
+        for entry in entries:
+            self._by_version.setdefault(entry["version"], entry)
+
+        # 已保存的历史本身就是有序的，只有顺序被破坏时才需要一次完整排序
+        unique_entries = list(self._by_version.values())
+        unique_entries.reverse()
+        keys = [version_key(entry["version"]) for entry in unique_entries]
+        if any(keys[i] > keys[i + 1] for i in range(len(keys) - 1)):
+            order = sorted(range(len(keys)), key=keys.__getitem__)
+            unique_entries = [unique_entries[i] for i in order]
+            keys = [keys[i] for i in order]
+        self._entries = unique_entries
+        self._keys = keys
+
+    @classmethod
+    def from_history(cls, history: "VersionHistory") -> "HistoryIndex":
+        """从版本历史对象构建索引"""
+        return cls(history["versions"])
+
+    def to_history(self) -> "VersionHistory":
+        """转换回可以保存的版本历史对象（最新的在前）"""
+        return {"versions": self._entries[::-1]}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, version: object) -> bool:
+        return version in self._by_version
+
+    def __iter__(self) -> Iterator["VersionHistoryEntry"]:
+        """按最新的在前的顺序迭代"""
+        return reversed(self._entries)
+
+    def get(self, version: str) -> Optional["VersionHistoryEntry"]:
+        """按版本号查找条目"""
+        return self._by_version.get(version)
+
+    def upsert(self, entry: "VersionHistoryEntry") -> bool:
+        """
+        插入新条目或替换同版本的已有条目，插入位置通过二分查找确定
+
+        Returns:
+            是否为新版本
+        """
+        version = entry["version"]
+        is_new = version not in self._by_version
+        if is_new:
+            key = version_key(version)
+            position = bisect.bisect_right(self._keys, key)
+            self._keys.insert(position, key)
+            self._entries.insert(position, entry)
+        else:
+            self._entries[self._position(version)] = entry
+        self._by_version[version] = entry
+        return is_new
+
+    def _position(self, version: str) -> Optional[int]:
+        """在升序列表中定位版本，排序key相同的不同版本字符串（如'1.6'和'1.6.0'）逐个比对"""
+        if version not in self._by_version:
+            return None
+        key = version_key(version)
+        position = bisect.bisect_left(self._keys, key)
+        while self._entries[position]["version"] != version:
+            position += 1
+        return position
+
+# Cursor API基础地址，直接使用不带www的域名，避免重定向
+CURSOR_BASE_URL = "https://cursor.com"
+
+# 请求Cursor API时使用的默认请求头
+DEFAULT_REQUEST_HEADERS: Dict[str, str] = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+    'Accept': 'application/json, text/plain, */*',
+    'Accept-Language': 'en-US,en;q=0.9',
+    'Cache-Control': 'no-cache',
+    'Pragma': 'no-cache',
+    'Referer': 'https://cursor.com/',
+    'Origin': 'https://cursor.com',
+}
+
+# 下载API使用的发布通道
+RELEASE_TRACK = "latest"
+
+# 运行期间生成的本地状态（缓存等）所在目录
+STATE_DIR_NAME = ".cache"
+
+class ResponseCache:
+    """
+    保存在磁盘上的下载API条件请求缓存
+
+    按平台和发布通道保存上次响应的ETag/Last-Modified以及downloadUrl，
+    后续请求携带If-None-Match/If-Modified-Since，服务端返回304时直接使用缓存结果。
     """
-    # 移除可能的 'v' 前缀
-    version_str = version_str.lstrip('v')
-    # 分割版本号并转换为整数
-    parts = []
-    for part in version_str.split('.'):
+
+    def __init__(self, path: Optional[Path] = None) -> None:
+        self.path = path or Path.cwd() / STATE_DIR_NAME / "download-api-cache.json"
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        self.hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+        self._dirty = False
+
+    @classmethod
+    def load(cls, path: Optional[Path] = None) -> "ResponseCache":
+        """从磁盘加载缓存，文件不存在或损坏时返回空缓存"""
+        cache = cls(path)
+        if cache.path.exists():
+            try:
+                with open(cache.path, 'r', encoding='utf-8') as f:
+                    entries = json.load(f)
+                if isinstance(entries, dict):
+                    cache.entries = entries
+            except Exception as error:
+                logger.warning(f'读取下载API缓存失败，将忽略缓存: {error}')
+        return cache
+
+    @staticmethod
+    def key(platform: str, release_track: str) -> str:
+        """缓存键：平台 + 发布通道"""
+        return f"{platform}@{release_track}"
+
+    def conditional_headers(self, platform: str, release_track: str) -> Dict[str, str]:
+        """根据缓存的验证器生成条件请求头"""
+        entry = self.entries.get(self.key(platform, release_track))
+        headers: Dict[str, str] = {}
+        if entry and entry.get("downloadUrl"):
+            if entry.get("etag"):
+                headers['If-None-Match'] = entry["etag"]
+            if entry.get("lastModified"):
+                headers['If-Modified-Since'] = entry["lastModified"]
+        return headers
+
+    def record_hit(self, platform: str, release_track: str) -> Optional[str]:
+        """记录一次304命中，返回缓存的downloadUrl"""
+        entry = self.entries.get(self.key(platform, release_track))
+        if not entry:
+            return None
+        self.hits += 1
+        self.bytes_saved += entry.get("size", 0)
+        return entry.get("downloadUrl")
+
+    def store(self, platform: str, release_track: str, response: httpx.Response, download_url: str) -> None:
+        """记录一次完整响应，并在服务端提供验证器时保存到缓存"""
+        self.misses += 1
+        etag = response.headers.get('ETag')
+        last_modified = response.headers.get('Last-Modified')
+        if not etag and not last_modified:
+            return
+        self.entries[self.key(platform, release_track)] = {
+            "etag": etag,
+            "lastModified": last_modified,
+            "downloadUrl": download_url,
+            "size": len(response.content)
+        }
+        self._dirty = True
+
+    def save(self) -> None:
+        """将缓存写回磁盘（仅在有变化时）"""
+        if not self._dirty:
+            return
+        if write_state_file(self.path, json.dumps(self.entries, indent=2), '下载API缓存'):
+            self._dirty = False
+
+    def log_stats(self) -> None:
+        """输出缓存命中率和节省的字节数"""
+        total = self.hits + self.misses
+        hit_rate = self.hits / total * 100 if total else 0.0
+        logger.info(f"下载API缓存: 命中 {self.hits}/{total} ({hit_rate:.1f}%)，节省 {self.bytes_saved} 字节")
+
+class ContentHashIndex:
+    """
+    记录每个输出文件上次写入内容的SHA-256，内容相同时跳过写入
+
+    同时记录写入后的文件大小和mtime：两者都没变时直接信任记录的哈希，
+    否则（例如git checkout之后或状态缓存丢失）重新计算现有文件的哈希，因此不会因为记录过期而漏写。
+    """
+
+    def __init__(self, path: Optional[Path] = None) -> None:
+        self.reset(path)
+
+    def reset(self, path: Optional[Path] = None) -> None:
+        """清空记录和上一次运行的计数"""
+        self.path = path or Path.cwd() / STATE_DIR_NAME / "content-hashes.json"
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        self.written = 0
+        self.skipped = 0
+        self._dirty = False
+
+    def load(self, path: Optional[Path] = None) -> "ContentHashIndex":
+        """从磁盘（重新）加载记录，文件不存在或损坏时从空记录开始"""
+        self.reset(path)
+        if self.path.exists():
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    entries = json.load(f)
+                if isinstance(entries, dict):
+                    self.entries = entries
+            except Exception as error:
+                logger.warning(f'读取内容哈希记录失败，将重新计算: {error}')
+        return self
+
+    @staticmethod
+    def key(path: Path) -> str:
+        """记录键：相对于当前目录的路径"""
         try:
-            parts.append(int(part))
+            return str(path.resolve().relative_to(Path.cwd().resolve()))
         except ValueError:
-            # 如果包含非数字字符，保持原字符串
-            parts.append(part)
-    return parts
+            return str(path.resolve())
+
+    def unchanged(self, path: Path, digest: str) -> bool:
+        """
+        判断文件现有内容的哈希是否等于digest
+
+        Args:
+            path: 目标文件
+            digest: 新内容的SHA-256十六进制摘要
+
+        Returns:
+            内容相同时返回True（此时应跳过写入）
+        """
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            return False
+        entry = self.entries.get(self.key(path))
+        if entry is None or entry.get("size") != stat.st_size or entry.get("mtimeNs") != stat.st_mtime_ns:
+            # 记录不存在或已过期，按现有文件内容计算哈希
+            with open(path, 'rb') as f:
+                current_digest = hashlib.sha256(f.read()).hexdigest()
+            entry = self._record_stat(path, current_digest, stat)
+        if entry["sha256"] == digest:
+            self.skipped += 1
+            logger.debug(f'{self.key(path)} 内容未变化，跳过写入')
+            return True
+        return False
+
+    def record(self, path: Path, digest: str) -> None:
+        """记录一次写入后的文件哈希"""
+        self.written += 1
+        self._record_stat(path, digest, path.stat())
+
+    def save(self) -> None:
+        """将记录写回磁盘（仅在有变化时）"""
+        if not self._dirty:
+            return
+        if write_state_file(self.path, json.dumps(self.entries, indent=2), '内容哈希记录'):
+            self._dirty = False
+
+    def log_stats(self) -> None:
+        """输出写入和跳过的文件数"""
+        logger.info(f"输出文件: 写入 {self.written} 个，内容未变化跳过 {self.skipped} 个")
+
+    def _record_stat(self, path: Path, digest: str, stat: os.stat_result) -> Dict[str, Any]:
+        entry = {"sha256": digest, "size": stat.st_size, "mtimeNs": stat.st_mtime_ns}
+        self.entries[self.key(path)] = entry
+        self._dirty = True
+        return entry
+
+# 全局内容哈希记录，main中从状态目录加载并在运行结束时保存
+content_hashes = ContentHashIndex()
+
+# 内容变化时才写入文件（原子替换）
+def write_file_if_changed(path: Path, data: bytes) -> bool:
+    """
+    Args:
+        path: 目标文件
+        data: 完整的文件内容
+
+    Returns:
+        是否实际写入了文件
+    """
+    digest = hashlib.sha256(data).hexdigest()
+    if content_hashes.unchanged(path, digest):
+        return False
+    temp_path = Path(f"{path}.tmp")
+    with open(temp_path, 'wb') as f:
+        f.write(data)
+    temp_path.replace(path)
+    content_hashes.record(path, digest)
+    return True
+
+# 单次请求的默认超时时间（秒）
+DEFAULT_REQUEST_TIMEOUT = 15.0
+
+# 单次运行的默认时间预算（秒）
+DEFAULT_RUN_DEADLINE = 120.0
+
+@dataclass
+class RetryPolicy:
+    """下载URL请求的重试策略"""
+
+    # 网络错误时的最大尝试次数
+    max_attempts: int = 3
+    # 首次重试前的基础等待时间（秒），之后每次翻倍
+    base_delay: float = 0.5
+    # 单次等待时间上限（秒）
+    max_delay: float = 8.0
+    # 抖动比例，实际等待时间在 [delay * (1 - jitter), delay] 之间随机
+    jitter: float = 0.5
+    # 按状态码设置的最大尝试次数，未列出的状态码不重试
+    status_attempts: Dict[int, int] = field(default_factory=lambda: {
+        408: 3, 429: 5, 500: 3, 502: 3, 503: 5, 504: 3
+    })
+
+    def max_attempts_for(self, status_code: Optional[int]) -> int:
+        """返回某个状态码允许的最大尝试次数，status_code为None表示网络错误"""
+        if status_code is None:
+            return self.max_attempts
+        return self.status_attempts.get(status_code, 1)
+
+    def backoff_delay(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """计算第attempt次失败后的等待时间，优先使用服务端给出的Retry-After"""
+        delay = min(self.max_delay, self.base_delay * (2 ** (attempt - 1)))
+        delay = random.uniform(delay * (1 - self.jitter), delay)
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.max_delay))
+        return delay
+
+class RunDeadline:
+    """整次运行的截止时间，保证重试不会让任务超出时间预算"""
+
+    def __init__(self, budget_seconds: Optional[float] = DEFAULT_RUN_DEADLINE) -> None:
+        """
+        Args:
+            budget_seconds: 时间预算（秒），为None时不限制
+        """
+        self.expires_at = time.monotonic() + budget_seconds if budget_seconds is not None else None
+
+    def remaining(self) -> Optional[float]:
+        """剩余时间（秒），不限制时返回None"""
+        if self.expires_at is None:
+            return None
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def allows(self, delay: float) -> bool:
+        """等待delay秒后是否仍在预算内"""
+        remaining = self.remaining()
+        return remaining is None or remaining > delay
+
+@dataclass
+class HedgePolicy:
+    """对冲请求策略：请求迟迟未返回时再发送一个相同的请求，先返回者胜出"""
+
+    # 是否启用对冲请求
+    enabled: bool = False
+    # 等待时间取该平台历史延迟的百分位数
+    percentile: float = 95.0
+    # 历史样本不足时使用的等待时间（秒）
+    fallback_delay: float = 2.0
+    # 等待时间下限（秒），避免对极快的请求也发送对冲请求
+    min_delay: float = 0.05
+    # 使用平台自身历史延迟所需的最少样本数，不足时使用所有平台的样本
+    min_samples: int = 5
+
+# 延迟直方图的桶上界（毫秒），最后一个桶收集所有更慢的请求
+LATENCY_BUCKETS_MS: List[float] = [
+    10, 25, 50, 75, 100, 150, 200, 300, 500, 750,
+    1000, 1500, 2000, 3000, 5000, 7500, 10000, 15000, 30000
+]
+
+class LatencyHistogram:
+    """
+    按平台累计的请求延迟直方图，跨运行持久化
+
+    每次获取记录延迟、最终状态和重试次数，只保存固定桶的计数，文件大小不随运行次数增长。
+    百分位数在桶内线性插值估算，用于计算对冲请求的等待时间以及调整超时和并发配置。
+    """
+
+    def __init__(self, path: Optional[Path] = None) -> None:
+        self.path = path
+        self.platforms: Dict[str, Dict[str, Any]] = {}
+
+    @classmethod
+    def load(cls, path: Optional[Path] = None) -> "LatencyHistogram":
+        """从磁盘加载直方图，桶定义变化或文件损坏时从空直方图开始"""
+        histogram = cls(path or Path.cwd() / STATE_DIR_NAME / "latency-histogram.json")
+        if histogram.path.exists():
+            try:
+                with open(histogram.path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                if data.get("bucketsMs") == LATENCY_BUCKETS_MS:
+                    histogram.platforms = data.get("platforms", {})
+                else:
+                    logger.warning('延迟直方图的桶定义已变化，将重新开始统计')
+            except Exception as error:
+                logger.warning(f'读取延迟直方图失败，将重新开始统计: {error}')
+        return histogram
+
+    def record(self, platform: str, seconds: float, status: Optional[int] = 200, retries: int = 0) -> None:
+        """
+        记录一次获取
+
+        Args:
+            platform: 平台标识符
+            seconds: 延迟（秒）
+            status: 最终状态码，网络错误时为None
+            retries: 重试次数
+        """
+        data = self.platforms.setdefault(platform, {
+            "count": 0,
+            "sumMs": 0.0,
+            "buckets": [0] * (len(LATENCY_BUCKETS_MS) + 1),
+            "status": {},
+            "retries": {}
+        })
+        latency_ms = seconds * 1000
+        data["count"] += 1
+        data["sumMs"] = round(data["sumMs"] + latency_ms, 3)
+        data["buckets"][bisect.bisect_left(LATENCY_BUCKETS_MS, latency_ms)] += 1
+        status_key = str(status) if status is not None else "error"
+        data["status"][status_key] = data["status"].get(status_key, 0) + 1
+        data["retries"][str(retries)] = data["retries"].get(str(retries), 0) + 1
+
+    def count(self, platform: Optional[str] = None) -> int:
+        """返回某个平台（或所有平台）的样本数"""
+        if platform is not None:
+            return self.platforms.get(platform, {}).get("count", 0)
+        return sum(data["count"] for data in self.platforms.values())
+
+    def percentile(self, platform: str, q: float, min_samples: int = 1) -> Optional[float]:
+        """
+        估算平台延迟的第q百分位数（秒）
+
+        平台自身样本不足min_samples时使用所有平台合并的直方图，仍然没有样本时返回None。
+        """
+        if self.count(platform) >= min_samples:
+            buckets = self.platforms[platform]["buckets"]
+        else:
+            buckets = [sum(counts) for counts in zip(*(data["buckets"] for data in self.platforms.values()))]
+        total = sum(buckets)
+        if not total:
+            return None
+
+        target = q / 100 * total
+        cumulative = 0
+        for index, bucket_count in enumerate(buckets):
+            if bucket_count and cumulative + bucket_count >= target:
+                lower = LATENCY_BUCKETS_MS[index - 1] if index > 0 else 0.0
+                # 最后一个桶没有上界，按最大有限上界计算
+                upper = LATENCY_BUCKETS_MS[index] if index < len(LATENCY_BUCKETS_MS) else LATENCY_BUCKETS_MS[-1]
+                fraction = (target - cumulative) / bucket_count
+                return (lower + (upper - lower) * fraction) / 1000
+            cumulative += bucket_count
+        return LATENCY_BUCKETS_MS[-1] / 1000
+
+    def save(self) -> None:
+        """将直方图紧凑地写回磁盘"""
+        if self.path is None:
+            return
+        data = {"bucketsMs": LATENCY_BUCKETS_MS, "platforms": self.platforms}
+        write_state_file(self.path, json.dumps(data, separators=(',', ':')), '延迟直方图')
+
+    def report(self) -> str:
+        """生成每个平台的p50/p95/p99报告"""
+        lines = [f"{'platform':<18}{'count':>8}{'mean':>10}{'p50':>10}{'p95':>10}{'p99':>10}  status / retries"]
+        for platform in sorted(self.platforms):
+            data = self.platforms[platform]
+            mean_ms = data["sumMs"] / data["count"] if data["count"] else 0.0
+            p50, p95, p99 = (self.percentile(platform, q) * 1000 for q in (50, 95, 99))
+            status = ' '.join(f"{key}={value}" for key, value in sorted(data["status"].items()))
+            retries = ' '.join(f"{key}={value}" for key, value in sorted(data["retries"].items(), key=lambda x: int(x[0])))
+            lines.append(f"{platform:<18}{data['count']:>8}{mean_ms:>8.0f}ms{p50:>8.0f}ms{p95:>8.0f}ms{p99:>8.0f}ms"
+                         f"  {status} / {retries}")
+        return '\n'.join(lines)
+
+@dataclass
+class FetchStats:
+    """单个平台的请求统计"""
+
+    attempts: int = 0
+    backoff_seconds: float = 0.0
+    last_status: Optional[int] = None
+    outcome: str = "pending"
+    hedged: int = 0
+
+class CursorApiSession:
+    """
+    持有共享连接池的Cursor API会话
+
+    整个运行过程只创建一个httpx.AsyncClient，所有平台请求以及重定向都复用
+    同一个支持keep-alive的连接池，请求头也只构建一次。通过httpcore的trace
+    扩展统计新建连接数和实际发出的请求数，用于在运行结束时报告连接复用情况。
+    """
+
+    def __init__(self,
+                 base_url: str = CURSOR_BASE_URL,
+                 timeout: float = DEFAULT_REQUEST_TIMEOUT,
+                 http2: bool = False,
+                 max_connections: int = 10,
+                 keepalive_expiry: float = 30.0,
+                 cache: Optional[ResponseCache] = None,
+                 retry_policy: Optional[RetryPolicy] = None,
+                 deadline: Optional[RunDeadline] = None,
+                 hedge_policy: Optional[HedgePolicy] = None,
+                 latency: Optional[LatencyHistogram] = None,
+                 transport: Optional[httpx.AsyncBaseTransport] = None) -> None:
+        """
+        Args:
+            base_url: Cursor API基础地址
+            timeout: 单次请求超时时间（秒）
+            http2: 是否启用HTTP/2多路复用（需要安装h2包，未安装时回退到HTTP/1.1）
+            max_connections: 连接池的最大连接数
+            keepalive_expiry: 空闲连接保持时间（秒）
+            cache: 条件请求缓存，为None时每次都获取完整响应
+            retry_policy: 重试策略，为None时使用默认策略
+            deadline: 本次运行的截止时间，为None时使用默认时间预算
+            hedge_policy: 对冲请求策略，为None时不发送对冲请求
+            latency: 历史延迟直方图，获取结果记录在其中，并用于计算对冲请求的等待时间
+            transport: 自定义的httpx传输层（如本地替身服务器），为None时使用真实网络
+        """
+        if http2:
+            try:
+                import h2  # noqa: F401
+            except ImportError:
+                logger.warning('未安装h2包，无法启用HTTP/2，将使用HTTP/1.1')
+                http2 = False
+
+        self.base_url = base_url.rstrip('/')
+        self.http2 = http2
+        self.cache = cache
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.deadline = deadline or RunDeadline()
+        self.fetch_stats: Dict[str, FetchStats] = {}
+        self.hedge_policy = hedge_policy or HedgePolicy()
+        self.latency = latency or LatencyHistogram()
+        self.headers: Dict[str, str] = dict(DEFAULT_REQUEST_HEADERS)
+        self.connections_opened = 0
+        self.requests_sent = 0
+        self.client = httpx.AsyncClient(
+            timeout=timeout,
+            follow_redirects=True,  # 启用自动重定向跟随
+            http2=http2,
+            headers=self.headers,
+            transport=transport,
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections,
+                keepalive_expiry=keepalive_expiry
+            )
+        )
+
+    async def __aenter__(self) -> "CursorApiSession":
+        return self
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        await self.aclose()
+
+    async def aclose(self) -> None:
+        """关闭底层连接池"""
+        await self.client.aclose()
+
+    async def _trace(self, event_name: str, info: Dict[str, Any]) -> None:
+        """httpcore trace回调，统计新建连接和发出的请求"""
+        if event_name == "connection.connect_tcp.started":
+            self.connections_opened += 1
+        elif event_name.endswith(".send_request_headers.started"):
+            self.requests_sent += 1
+
+    async def get(self, url: str, **kwargs: Any) -> httpx.Response:
+        """使用共享连接池发送GET请求"""
+        extensions = dict(kwargs.pop("extensions", None) or {})
+        extensions["trace"] = self._trace
+        # 单次请求的超时不超过本次运行的剩余时间
+        remaining = self.deadline.remaining()
+        if remaining is not None and "timeout" not in kwargs:
+            kwargs["timeout"] = min(self.client.timeout.read or remaining, remaining)
+        return await self.client.get(url, extensions=extensions, **kwargs)
+
+    def stats_for(self, platform: str) -> FetchStats:
+        """返回指定平台的请求统计"""
+        return self.fetch_stats.setdefault(platform, FetchStats())
+
+    @property
+    def connections_reused(self) -> int:
+        """复用已有连接发出的请求数"""
+        return max(0, self.requests_sent - self.connections_opened)
+
+    def hedge_delay(self, platform: str) -> float:
+        """返回发送对冲请求前的等待时间（秒）"""
+        policy = self.hedge_policy
+        delay = self.latency.percentile(platform, policy.percentile, policy.min_samples)
+        return max(policy.min_delay, delay if delay is not None else policy.fallback_delay)
+
+    def log_fetch_stats(self) -> None:
+        """输出每个平台的尝试次数和退避等待时间"""
+        for platform, stats in self.fetch_stats.items():
+            hedged = f"，对冲请求 {stats.hedged} 次" if stats.hedged else ""
+            logger.info(f"平台 {platform}: 结果 {stats.outcome}，尝试 {stats.attempts} 次，"
+                        f"退避等待 {stats.backoff_seconds:.2f} 秒{hedged}")
+
+    def log_pool_stats(self) -> None:
+        """输出连接池统计信息"""
+        protocol = "HTTP/2" if self.http2 else "HTTP/1.1"
+        logger.info(f"连接池统计({protocol}): 发出请求 {self.requests_sent} 次，"
+                    f"新建连接 {self.connections_opened} 个，复用连接 {self.connections_reused} 次")
+
+class FetchError(Exception):
+    """单次下载URL请求失败，携带状态码（网络错误时为None）和服务端建议的重试等待时间"""
+
+    def __init__(self, message: str, status_code: Optional[int] = None, retry_after: Optional[float] = None) -> None:
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+# 解析Retry-After响应头（仅支持秒数形式）
+def parse_retry_after(response: httpx.Response) -> Optional[float]:
+    """返回Retry-After头中的秒数，无法解析时返回None"""
+    value = response.headers.get('Retry-After')
+    try:
+        return max(0.0, float(value)) if value else None
+    except ValueError:
+        return None
+
+# 单次请求平台的最新下载URL
+async def request_download_url(platform: str, session: CursorApiSession) -> Optional[str]:
+    """
+    向Cursor API发送一次请求（包括手动跟随重定向），不做任何重试
+
+    Args:
+        platform: 平台标识符，如'darwin-universal'
+        session: 共享的API会话
+
+    Returns:
+        下载URL，响应中没有可用的downloadUrl时返回None
+
+    Raises:
+        FetchError: 网络错误或非200状态码
+    """
+    # 构建请求URL
+    url = f"{session.base_url}/api/download?platform={platform}&releaseTrack={RELEASE_TRACK}"
+
+    # 有缓存时发送条件请求
+    headers = session.cache.conditional_headers(platform, RELEASE_TRACK) if session.cache else {}
+
+    try:
+        # 发送请求并处理响应
+        response = await session.get(url, headers=headers)
+
+        # 内容未变化，直接使用缓存的下载链接
+        if response.status_code == 304 and session.cache:
+            cached_url = session.cache.record_hit(platform, RELEASE_TRACK)
+            if cached_url:
+                session.stats_for(platform).last_status = response.status_code
+                return cached_url
+
+        # 检查状态码，只记录非200状态码的请求，减少日志输出
+        if response.status_code != 200:
+            logger.warning(f"平台 {platform} 请求返回非200状态码: {response.status_code}, URL: {response.url}")
+            # 如果是重定向相关状态码但自动重定向失败，尝试手动处理
+            if response.status_code in [301, 302, 307, 308]:
+                redirect_url = response.headers.get('Location')
+                if redirect_url:
+                    logger.info(f"尝试手动跟随重定向: {redirect_url}")
+                    # 如果重定向URL是相对路径，转换为绝对URL
+                    if not redirect_url.startswith('http'):
+                        redirect_url = f"{session.base_url}/{redirect_url.lstrip('/')}"
+                    # 发送新请求
+                    response = await session.get(redirect_url, headers=headers)
+                    if response.status_code != 200:
+                        raise FetchError(f"重定向后仍然失败，状态码: {response.status_code}",
+                                         response.status_code, parse_retry_after(response))
+            else:
+                raise FetchError(f"HTTP error! status: {response.status_code}",
+                                 response.status_code, parse_retry_after(response))
+    except httpx.RequestError as e:
+        raise FetchError(f"网络错误: {e!r}") from e
+
+    session.stats_for(platform).last_status = response.status_code
+
+    # 解析JSON响应
+    try:
+        data = response.json()
+        download_url = data.get("downloadUrl")
+        if not download_url:
+            logger.warning(f"平台 {platform} 的响应中没有downloadUrl字段")
+        elif session.cache:
+            session.cache.store(platform, RELEASE_TRACK, response, download_url)
+        return download_url
+    except json.JSONDecodeError as e:
+        logger.error(f"解析JSON响应失败: {e}, 响应内容: {response.text[:200]}...")
+        return None
+
+# 带对冲的单次请求
+async def hedged_request_download_url(platform: str, session: CursorApiSession) -> Optional[str]:
+    """
+    发送一次请求；启用对冲且超过历史延迟百分位仍未返回时，再发送一个相同的请求
+
+    先成功返回的请求胜出，另一个请求被取消；两个请求都失败时抛出最后一个错误。
+
+    Args:
+        platform: 平台标识符
+        session: 共享的API会话
+
+    Returns:
+        下载URL，响应中没有可用的downloadUrl时返回None
+
+    Raises:
+        FetchError: 所有请求都失败
+    """
+    if not session.hedge_policy.enabled:
+        return await request_download_url(platform, session)
+
+    delay = session.hedge_delay(platform)
+    primary = asyncio.ensure_future(request_download_url(platform, session))
+    done, _ = await asyncio.wait({primary}, timeout=delay)
+    if done:
+        return primary.result()
+
+    logger.info(f"平台 {platform} 的请求超过 {delay:.2f} 秒未返回，发送对冲请求")
+    session.stats_for(platform).hedged += 1
+    pending = {primary, asyncio.ensure_future(request_download_url(platform, session))}
+    error: Optional[BaseException] = None
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
 
 # 获取平台的最新下载URL
-async def fetch_latest_download_url(platform: str) -> Optional[str]:
+async def fetch_latest_download_url(platform: str, session: Optional[CursorApiSession] = None) -> Optional[str]:
     """
     从Cursor API获取指定平台的最新下载URL
 
+    网络错误和可重试的状态码会按会话的重试策略以指数退避重试，
+    重试不会超过本次运行的截止时间。
+
     Args:
         platform: 平台标识符，如'darwin-universal'
+        session: 共享的API会话，未提供时为本次请求单独创建一个
 
     Returns:
         下载URL或None（如果请求失败）
     """
-    try:
-        # 创建一个支持重定向的HTTP客户端
-        async with httpx.AsyncClient(
-            timeout=15.0,  # 增加超时时间
-            follow_redirects=True  # 启用自动重定向跟随
-        ) as client:
-            # 构建请求URL
-            base_url = "https://cursor.com"  # 直接使用不带www的域名，避免重定向
-            url = f"{base_url}/api/download?platform={platform}&releaseTrack=latest"
-
-            # 设置更完整的请求头
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-                'Accept': 'application/json, text/plain, */*',
-                'Accept-Language': 'en-US,en;q=0.9',
-                'Cache-Control': 'no-cache',
-                'Pragma': 'no-cache',
-                'Referer': 'https://cursor.com/',
-                'Origin': 'https://cursor.com',
-                'Connection': 'keep-alive',
-            }
-
-            # 发送请求并处理响应
-            response = await client.get(url, headers=headers)
-
-            # 只记录非200状态码的请求，减少日志输出
-            if response.status_code != 200:
-                logger.info(f"请求URL: {url}, 状态码: {response.status_code}, 最终URL: {response.url}")
-
-            # 检查状态码
-            if response.status_code != 200:
-                logger.warning(f"平台 {platform} 请求返回非200状态码: {response.status_code}, URL: {response.url}")
-                # 如果是重定向相关状态码但自动重定向失败，尝试手动处理
-                if response.status_code in [301, 302, 307, 308]:
-                    redirect_url = response.headers.get('Location')
-                    if redirect_url:
-                        logger.info(f"尝试手动跟随重定向: {redirect_url}")
-                        # 如果重定向URL是相对路径，转换为绝对URL
-                        if not redirect_url.startswith('http'):
-                            redirect_url = f"{base_url.rstrip('/')}/{redirect_url.lstrip('/')}"
-                        # 发送新请求
-                        response = await client.get(redirect_url, headers=headers)
-                        if response.status_code != 200:
-                            raise Exception(f"重定向后仍然失败，状态码: {response.status_code}")
-                else:
-                    raise Exception(f"HTTP error! status: {response.status_code}")
+    if session is None:
+        async with CursorApiSession() as own_session:
+            return await fetch_latest_download_url(platform, own_session)
+
+    stats = session.stats_for(platform)
+    # 会话统计累计同一平台的所有获取（如探测和之后的完整获取），这里只报告本次获取的尝试次数
+    attempts_before = stats.attempts
+    started_at = time.monotonic()
+    with tracer.span("fetch_platform", platform=platform) as span:
+        download_url = await fetch_with_retries(platform, session)
+        attempts = stats.attempts - attempts_before
+        span.update(outcome=stats.outcome, status=stats.last_status, attempts=attempts)
+    metrics.observe_fetch(platform, time.monotonic() - started_at, stats.outcome, attempts)
+    return download_url
+
+# 按重试策略获取平台的最新下载URL
+async def fetch_with_retries(platform: str, session: CursorApiSession) -> Optional[str]:
+    """
+    请求平台的最新下载URL，失败时按会话的重试策略和截止时间重试
 
-            # 解析JSON响应
-            try:
-                data = response.json()
-                download_url = data.get("downloadUrl")
-                if not download_url:
-                    logger.warning(f"平台 {platform} 的响应中没有downloadUrl字段")
-                return download_url
-            except json.JSONDecodeError as e:
-                logger.error(f"解析JSON响应失败: {e}, 响应内容: {response.text[:200]}...")
+    尝试次数按本次调用单独计数，之前对同一平台的获取（如探测）用掉的次数不影响重试上限，
+    每次尝试同时累加到会话的FetchStats中。
+
+    Args:
+        platform: 平台标识符
+        session: 共享的API会话
+
+    Returns:
+        下载URL或None（如果请求失败）
+    """
+    policy = session.retry_policy
+    stats = session.stats_for(platform)
+
+    attempts = 0
+
+    while True:
+        attempts += 1
+        stats.attempts += 1
+        started_at = time.monotonic()
+        try:
+            download_url = await hedged_request_download_url(platform, session)
+            stats.outcome = "ok" if download_url else "empty"
+            session.latency.record(platform, time.monotonic() - started_at, stats.last_status, attempts - 1)
+            return download_url
+        except FetchError as error:
+            stats.last_status = error.status_code
+            if attempts >= policy.max_attempts_for(error.status_code):
+                logger.error(f"获取平台 {platform} 的下载URL失败（已尝试 {attempts} 次）: {error}")
+                stats.outcome = "failed"
+                session.latency.record(platform, time.monotonic() - started_at, error.status_code, attempts - 1)
                 return None
 
-    except httpx.RequestError as e:
-        logger.error(f"请求平台 {platform} 时发生网络错误: {e}")
+            delay = policy.backoff_delay(attempts, error.retry_after)
+            if not session.deadline.allows(delay):
+                logger.error(f"获取平台 {platform} 的下载URL失败，剩余运行时间不足以继续重试: {error}")
+                stats.outcome = "deadline"
+                session.latency.record(platform, time.monotonic() - started_at, error.status_code, attempts - 1)
+                return None
+
+            logger.warning(f"平台 {platform} 第 {attempts} 次请求失败: {error}，{delay:.2f}秒后重试")
+            await asyncio.sleep(delay)
+            stats.backoff_seconds += delay
+        except Exception as error:
+            logger.error(f"获取平台 {platform} 的下载URL时出错: {error}")
+            stats.outcome = "failed"
+            return None
+
+# 并发获取所有平台的最新下载URL
+async def fetch_all_platforms(max_concurrency: int = DEFAULT_FETCH_CONCURRENCY,
+                              session: Optional[CursorApiSession] = None,
+                              prefetched: Optional[Dict[str, str]] = None) -> Dict[str, Dict[str, VersionInfo]]:
+    """
+    同时向所有平台发送请求，并按操作系统分组收集结果
+
+    单个平台失败不会影响其他平台，失败的平台只是不出现在结果中。
+
+    Args:
+        max_concurrency: 同时进行的最大请求数
+        session: 共享的API会话，未提供时在本次调用内创建并关闭
+        prefetched: 已经获取过的平台下载URL（如探测结果），这些平台不再重复请求
+
+    Returns:
+        results[os_key][platform] 结构的下载URL和版本信息
+    """
+    if session is None:
+        async with CursorApiSession() as own_session:
+            return await fetch_all_platforms(max_concurrency, own_session, prefetched)
+
+    prefetched = prefetched or {}
+
+    semaphore = asyncio.Semaphore(max(1, max_concurrency))
+
+    async def fetch_one(platform: str) -> Optional[str]:
+        if platform in prefetched:
+            return prefetched[platform]
+        async with semaphore:
+            return await fetch_latest_download_url(platform, session)
+
+    tasks = [(os_key, platform) for os_key, os_data in PLATFORMS.items() for platform in os_data["platforms"]]
+    outcomes = await asyncio.gather(*(fetch_one(platform) for _, platform in tasks), return_exceptions=True)
+
+    results: Dict[str, Dict[str, VersionInfo]] = {os_key: {} for os_key in PLATFORMS}
+    for (os_key, platform), outcome in zip(tasks, outcomes):
+        if isinstance(outcome, BaseException):
+            logger.error(f"获取平台 {platform} 的下载URL时出现未处理的异常: {outcome}")
+            continue
+        if outcome:
+            with tracer.span("extract_version", platform=platform):
+                results[os_key][platform] = {"url": outcome, "version": extract_version(outcome)}
+
+    return results
+
+# 旧版单文件版本历史的文件名，仅用于迁移
+LEGACY_HISTORY_FILE_NAME = "version-history.json"
+
+# 分片存储版本历史的目录
+HISTORY_DIR_NAME = "history"
+
+# 不是有效版本号的条目所在的分片
+UNKNOWN_SERIES = "unknown"
+
+# 追加日志超过此大小时合并回分片快照
+JOURNAL_COMPACT_BYTES = 64 * 1024
+
+# 版本历史存储后端："json"（history/分片）或 "sqlite"（只在本地使用，数据库文件不纳入版本控制）
+HISTORY_BACKEND = os.environ.get("CURSOR_HISTORY_BACKEND", "json")
+
+# SQLite后端的数据库文件
+HISTORY_DB_PATH = Path(os.environ.get("CURSOR_HISTORY_DB", "history.sqlite3"))
+
+# 逐段生成JSON文本
+def iter_json_chunks(data: Dict[str, Any], indent: int = 2) -> Iterator[str]:
+    """
+    逐段编码JSON对象，输出与json.dumps(data, indent=indent)逐字节相同
+
+    顶层对象中的列表和生成器逐个元素编码，元素可以由生成器按需产生，不需要先构建完整的文档。
+    编码即校验：NaN/Infinity、不支持的类型和非字符串的键都会在编码时抛出异常。
+    JSON字符串中的换行总是被转义，因此把编码片段中的换行替换为换行加缩进即可得到嵌套缩进。
+
+    Args:
+        data: 顶层JSON对象
+        indent: 缩进空格数
+
+    Yields:
+        JSON文本片段
+    """
+    encoder = json.JSONEncoder(indent=indent, allow_nan=False)
+    member_indent = '\n' + ' ' * indent
+    item_indent = member_indent + ' ' * indent
+
+    if not data:
+        yield '{}'
+        return
+    for member_index, (key, value) in enumerate(data.items()):
+        if not isinstance(key, str):
+            raise TypeError(f'JSON对象的键必须是字符串: {key!r}')
+        yield ('{' if member_index == 0 else ',') + member_indent + encoder.encode(key) + ': '
+        if isinstance(value, (list, tuple)) or inspect.isgenerator(value):
+            empty = True
+            for item in value:
+                yield ('[' if empty else ',') + item_indent
+                empty = False
+                for chunk in encoder.iterencode(item):
+                    yield chunk.replace('\n', item_indent)
+            yield '[]' if empty else member_indent + ']'
+        else:
+            for chunk in encoder.iterencode(value):
+                yield chunk.replace('\n', member_indent)
+    yield '\n}'
+
+# 写入JSON文件（原子替换）
+def write_json_file(path: Path, data: Dict[str, Any]) -> bool:
+    """
+    将JSON对象流式写入临时文件并重命名，避免部分写入
+
+    不再先生成完整的JSON字符串再解析回来校验：编码片段直接写入文件，校验在编码时完成，
+    内存占用只与单个元素有关。编码的同时计算哈希，与目标文件现有内容相同时丢弃临时文件，
+    目标文件保持不变。
+
+    Args:
+        path: 目标文件
+        data: 要写入的顶层JSON对象，其中的列表可以是生成器
+
+    Returns:
+        是否实际替换了目标文件
+
+    Raises:
+        ValueError: 数据无法编码为有效的JSON
+    """
+    # 先写入临时文件，然后重命名以避免部分写入
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = Path(f"{path}.tmp")
+    hasher = hashlib.sha256()
+    try:
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            for chunk in iter_json_chunks(data):
+                hasher.update(chunk.encode('utf-8'))
+                f.write(chunk)
+    except (TypeError, ValueError) as encode_error:
+        temp_path.unlink(missing_ok=True)
+        raise ValueError(f'生成了无效的JSON数据，中止保存: {encode_error}') from encode_error
+
+    digest = hasher.hexdigest()
+    if content_hashes.unchanged(path, digest):
+        temp_path.unlink()
+        return False
+    temp_path.replace(path)
+    content_hashes.record(path, digest)
+    return True
+
+# 各平台下载URL的模板，{build}为构建哈希，{version}为版本号
+DOWNLOAD_URL_TEMPLATES: Dict[str, str] = {
+    "darwin-universal": "https://downloads.cursor.com/production/{build}/darwin/universal/Cursor-darwin-universal.dmg",
+    "darwin-x64": "https://downloads.cursor.com/production/{build}/darwin/x64/Cursor-darwin-x64.dmg",
+    "darwin-arm64": "https://downloads.cursor.com/production/{build}/darwin/arm64/Cursor-darwin-arm64.dmg",
+    "win32-x64": "https://downloads.cursor.com/production/{build}/win32/x64/system-setup/CursorSetup-x64-{version}.exe",
+    "win32-arm64": "https://downloads.cursor.com/production/{build}/win32/arm64/system-setup/CursorSetup-arm64-{version}.exe",
+    "linux-x64": "https://downloads.cursor.com/production/{build}/linux/x64/Cursor-{version}-x86_64.AppImage",
+    "linux-arm64": "https://downloads.cursor.com/production/{build}/linux/arm64/Cursor-{version}-aarch64.AppImage",
+}
+
+# 紧凑编码中引用URL模板的前缀（下载URL不会以它开头）
+URL_TEMPLATE_REF = "@"
+
+# 将版本历史条目编码为紧凑格式
+def encode_history_entry(entry: VersionHistoryEntry, templates: Dict[str, str]) -> Dict[str, Any]:
+    """
+    只保存一次构建哈希，各平台的URL改为引用模板；不符合模板的URL保留原文
+
+    编码后会立即解码并与原条目逐字节比较，不一致时退回保存原始条目。
+
+    Args:
+        entry: 版本历史条目
+        templates: 模板名称 -> URL模板
+
+    Returns:
+        紧凑格式的条目（无法编码时为原条目）
+    """
+    build_counts: Dict[str, int] = {}
+    for url in entry["platforms"].values():
+        commit = parse_download_url(url).commit
+        if commit:
+            build_counts[commit] = build_counts.get(commit, 0) + 1
+    if not build_counts:
+        return entry
+    build = max(build_counts, key=build_counts.__getitem__)
+
+    platforms: Dict[str, str] = {}
+    for platform, url in entry["platforms"].items():
+        template = templates.get(platform)
+        if template is not None and template.format(build=build, version=entry["version"]) == url:
+            platforms[platform] = URL_TEMPLATE_REF + platform
+        else:
+            platforms[platform] = url
+    compact = {"version": entry["version"], "date": entry["date"], "build": build, "platforms": platforms}
+
+    if json.dumps(decode_history_entry(compact, templates)) != json.dumps(entry):
+        logger.warning(f'版本 {entry["version"]} 的紧凑编码无法还原，保存原始URL')
+        return entry
+    return compact
+
+# 将紧凑格式的条目还原为完整的版本历史条目
+def decode_history_entry(compact: Dict[str, Any], templates: Dict[str, str]) -> VersionHistoryEntry:
+    """
+    Args:
+        compact: encode_history_entry生成的条目，未编码的条目原样返回
+        templates: 模板名称 -> URL模板
+
+    Returns:
+        包含完整URL的条目
+
+    Raises:
+        ValueError: 引用了不存在的模板
+    """
+    build = compact.get("build")
+    if build is None:
+        return compact
+    platforms: Dict[str, str] = {}
+    for platform, value in compact["platforms"].items():
+        if value.startswith(URL_TEMPLATE_REF):
+            template = templates.get(value[len(URL_TEMPLATE_REF):])
+            if template is None:
+                raise ValueError(f'版本 {compact["version"]} 引用了未知的URL模板: {value}')
+            value = template.format(build=build, version=compact["version"])
+        platforms[platform] = value
+    return {"version": compact["version"], "date": compact["date"], "platforms": platforms}
+
+# 版本所属的 major.minor 系列
+def version_series(version: str) -> str:
+    """返回版本所属的分片系列，如 '3.15.6' -> '3.15'，无效版本归入'unknown'"""
+    parsed = parse_version(version)
+    if not parsed.is_valid:
+        return UNKNOWN_SERIES
+    return f"{parsed.release[0]}.{parsed.release[1]}"
+
+# 分片系列的排序key
+def series_key(series: str) -> Tuple[Any, ...]:
+    """系列按版本排序，'unknown'排在最后（即最旧）"""
+    return version_key(series) if series != UNKNOWN_SERIES else (0,)
+
+class ShardedHistoryStore:
+    """
+    按 major.minor 系列分片存储的版本历史
+
+    每个系列一个JSON文件（如 history/3.15.json），manifest.json 记录所有分片以及
+    每个分片的条目数和最新版本。分片按需加载，一次运行通常只读取新版本所在的分片，
+    每次运行的I/O不随历史总量增长，因此不再需要截断历史。
+
+    分片中的条目使用紧凑编码（构建哈希加URL模板引用，模板保存在manifest中），
+    加载分片时才展开为完整URL。
+
+    分片和manifest是快照，新增或更新的条目先以JSON Lines的形式追加到journal.jsonl，
+    每次保存只写入新条目；日志超过JOURNAL_COMPACT_BYTES时才合并回快照并清空。
+    打开存储时在快照之上重放日志，重放是幂等的，因此在合并或追加途中中断都可以直接恢复。
+    """
+
+    def __init__(self, root: Optional[Path] = None) -> None:
+        """
+        Args:
+            root: 分片目录，默认为当前目录下的history/
+        """
+        self.root = root or Path.cwd() / HISTORY_DIR_NAME
+        self.manifest_path = self.root / "manifest.json"
+        self.journal_path = self.root / "journal.jsonl"
+        self.shards: Dict[str, Dict[str, Any]] = {}
+        self.url_templates: Dict[str, str] = dict(DOWNLOAD_URL_TEMPLATES)
+        self.journal_records = 0
+        self._loaded: Dict[str, HistoryIndex] = {}
+        # 与快照不一致（修改记录在日志中或尚未保存）的系列
+        self._dirty: set = set()
+        # 尚未追加到日志的条目
+        self._pending: List[VersionHistoryEntry] = []
+        if self.manifest_path.exists():
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+            self.shards = {shard["series"]: shard for shard in manifest.get("shards", [])}
+            # 已保存的条目引用的是manifest中的模板，即使代码中的模板后来有变化也能正确还原
+            self.url_templates.update(manifest.get("urlTemplates", {}))
+        self._replay_journal()
+
+    def exists(self) -> bool:
+        """分片存储是否已经初始化"""
+        return self.manifest_path.exists() or self.journal_path.exists()
+
+    @property
+    def location(self) -> Path:
+        """用于日志的存储位置"""
+        return self.manifest_path
+
+    def close(self) -> None:
+        """分片存储没有需要释放的资源，未保存的修改需要先调用save()"""
+
+    @property
+    def series(self) -> List[str]:
+        """所有系列，最新的在前"""
+        return sorted(self.shards, key=series_key, reverse=True)
+
+    @property
+    def latest_version(self) -> Optional[str]:
+        """所有分片中的最新版本"""
+        for series in self.series:
+            if self.shards[series].get("latest"):
+                return self.shards[series]["latest"]
         return None
-    except Exception as error:
-        logger.error(f"获取平台 {platform} 的下载URL时出错: {error}")
+
+    def __len__(self) -> int:
+        return sum(shard.get("count", 0) for shard in self.shards.values())
+
+    def __contains__(self, version: object) -> bool:
+        return isinstance(version, str) and self.get(version) is not None
+
+    def load_shard(self, series: str) -> HistoryIndex:
+        """按需加载一个分片，不存在时返回空分片"""
+        if series not in self._loaded:
+            entries: List[VersionHistoryEntry] = []
+            shard = self.shards.get(series)
+            if shard is not None:
+                with open(self.root / shard["file"], 'r', encoding='utf-8') as f:
+                    entries = [decode_history_entry(entry, self.url_templates) for entry in json.load(f)["versions"]]
+            self._loaded[series] = HistoryIndex(entries)
+        return self._loaded[series]
+
+    def get(self, version: str) -> Optional[VersionHistoryEntry]:
+        """按版本号查找条目，只读取该版本所在的分片"""
+        series = version_series(version)
+        if series not in self.shards and series not in self._loaded:
+            return None
+        return self.load_shard(series).get(version)
+
+    def upsert(self, entry: VersionHistoryEntry) -> bool:
+        """
+        插入或替换条目，修改只在调用save()后写入磁盘
+
+        Returns:
+            是否为新版本
+        """
+        existing = self.get(entry["version"])
+        if existing is not None and json.dumps(existing) == json.dumps(entry):
+            # 内容完全相同，不产生日志记录
+            return False
+        is_new = self._apply(entry)
+        self._pending.append(entry)
+        return is_new
+
+    def iter_recent(self, limit: Optional[int] = None) -> Iterator[VersionHistoryEntry]:
+        """
+        按最新的在前的顺序迭代条目，只加载覆盖前limit个条目所需的分片
+
+        Args:
+            limit: 最多返回的条目数，为None时返回全部
+        """
+        remaining = limit
+        for series in self.series:
+            for entry in self.load_shard(series):
+                if remaining is not None:
+                    if remaining <= 0:
+                        return
+                    remaining -= 1
+                yield entry
+
+    def to_history(self) -> VersionHistory:
+        """读取所有分片，组装成完整的版本历史对象"""
+        return {"versions": list(self.iter_recent())}
+
+    def series_summary(self) -> List[Dict[str, Any]]:
+        """各系列的版本数和最新版本（最新的系列在前），只读取manifest"""
+        return [{"series": series, "count": self.shards[series]["count"], "latest": self.shards[series]["latest"]}
+                for series in self.series]
+
+    def iter_series(self, series: str) -> Iterator[VersionHistoryEntry]:
+        """按最新的在前的顺序迭代一个系列的条目，只读取该系列的分片"""
+        if series not in self.shards and series not in self._loaded:
+            return iter(())
+        return iter(self.load_shard(series))
+
+    def latest_build_before(self, platform: str, date: str) -> Optional[VersionHistoryEntry]:
+        """
+        查找指定日期之前发布、包含该平台的最新版本（按版本号比较）
+
+        分片存储没有日期索引，需要按版本从新到旧扫描；大量历史请使用SQLite后端
+
+        Args:
+            platform: 平台名称，如 'linux-arm64'
+            date: YYYY-MM-DD 格式的日期（不含当天）
+
+        Returns:
+            找到的条目，没有则返回None
+        """
+        for entry in self.iter_recent():
+            if entry["date"] < date and platform in entry["platforms"]:
+                return entry
         return None
 
-# 从JSON文件读取版本历史
+    def import_history(self, history: VersionHistory) -> None:
+        """
+        用给定的完整历史替换分片内容（用于迁移和整体保存）
+
+        Args:
+            history: 完整的版本历史对象
+        """
+        grouped: Dict[str, List[VersionHistoryEntry]] = {}
+        for entry in history["versions"]:
+            grouped.setdefault(version_series(entry["version"]), []).append(entry)
+
+        for series in set(self.shards) - set(grouped):
+            (self.root / self.shards.pop(series)["file"]).unlink(missing_ok=True)
+            self._loaded.pop(series, None)
+            self._dirty.discard(series)
+        for series, entries in grouped.items():
+            self._loaded[series] = HistoryIndex(entries)
+            self._dirty.add(series)
+            self._refresh_manifest_entry(series)
+        # 完整历史直接写成快照，之前的日志和未保存的条目都已包含在内
+        self.compact()
+
+    def save(self) -> None:
+        """
+        将未保存的条目追加到日志，写入量只与新条目数相关；日志超过阈值时合并回快照
+        """
+        if self._pending:
+            self.root.mkdir(parents=True, exist_ok=True)
+            records = ''.join(json.dumps({"op": "upsert", "entry": entry}, ensure_ascii=False) + '\n'
+                              for entry in self._pending)
+            with open(self.journal_path, 'a', encoding='utf-8') as f:
+                f.write(records)
+                f.flush()
+                os.fsync(f.fileno())
+            self.journal_records += len(self._pending)
+            self._pending.clear()
+
+        if self.journal_path.exists() and self.journal_path.stat().st_size > JOURNAL_COMPACT_BYTES:
+            logger.info(f'版本历史日志超过 {JOURNAL_COMPACT_BYTES // 1024} KiB，合并到分片快照')
+            self.compact()
+
+    def compact(self) -> None:
+        """
+        将日志中的修改合并回分片快照和manifest，然后删除日志
+
+        先写快照再删除日志：在两者之间中断时，下次打开会再次重放已包含在快照中的记录，结果不变。
+        未保存的条目也一并写入快照。
+        """
+        for series in sorted(self._dirty):
+            write_json_file(self.root / self.shards[series]["file"], {
+                "series": series,
+                "versions": (encode_history_entry(entry, self.url_templates) for entry in self._loaded[series])
+            })
+        self._dirty.clear()
+        self._pending.clear()
+        write_json_file(self.manifest_path, {
+            "latest": self.latest_version,
+            "urlTemplates": self.url_templates,
+            "shards": [self.shards[series] for series in self.series]
+        })
+        self.journal_path.unlink(missing_ok=True)
+        self.journal_records = 0
+
+    def _apply(self, entry: VersionHistoryEntry) -> bool:
+        series = version_series(entry["version"])
+        is_new = self.load_shard(series).upsert(entry)
+        self._dirty.add(series)
+        self._refresh_manifest_entry(series)
+        return is_new
+
+    def _replay_journal(self) -> None:
+        """在快照之上重放日志；追加途中中断留下的不完整末行会被截掉"""
+        if not self.journal_path.exists():
+            return
+        with open(self.journal_path, 'rb') as f:
+            data = f.read()
+
+        complete_length = data.rfind(b'\n') + 1
+        if complete_length < len(data):
+            logger.warning(f'版本历史日志末尾有 {len(data) - complete_length} 字节的不完整记录，已丢弃')
+            with open(self.journal_path, 'r+b') as f:
+                f.truncate(complete_length)
+
+        for line_number, line in enumerate(data[:complete_length].splitlines(), 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as error:
+                logger.warning(f'跳过版本历史日志第 {line_number} 行的无效记录: {error}')
+                continue
+            if record.get("op") == "upsert":
+                self._apply(record["entry"])
+                self.journal_records += 1
+
+    def _refresh_manifest_entry(self, series: str) -> None:
+        shard = self._loaded[series]
+        newest = next(iter(shard), None)
+        self.shards[series] = {
+            "series": series,
+            "file": f"{series}.json",
+            "count": len(shard),
+            "latest": newest["version"] if newest else None
+        }
+
+class SqliteHistoryStore:
+    """
+    基于标准库sqlite3的版本历史存储（可选后端）
+
+    versions、platforms、urls三张表，versions按版本排序token（Version.sort_token）、日期和 major.minor 系列建索引，
+    urls按平台建索引，按平台、日期、系列或版本的查询不需要解析整个历史。使用WAL模式，
+    修改在调用save()时作为一个事务提交。接口与ShardedHistoryStore相同。
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS versions (
+            id INTEGER PRIMARY KEY,
+            version TEXT NOT NULL UNIQUE,
+            sort_key TEXT NOT NULL,
+            date TEXT NOT NULL,
+            series TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS platforms (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL UNIQUE
+        );
+        CREATE TABLE IF NOT EXISTS urls (
+            version_id INTEGER NOT NULL REFERENCES versions(id) ON DELETE CASCADE,
+            platform_id INTEGER NOT NULL REFERENCES platforms(id),
+            position INTEGER NOT NULL,
+            url TEXT NOT NULL,
+            PRIMARY KEY (version_id, platform_id)
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS idx_versions_sort_key ON versions(sort_key);
+        CREATE INDEX IF NOT EXISTS idx_versions_date ON versions(date, sort_key);
+        CREATE INDEX IF NOT EXISTS idx_versions_series ON versions(series, sort_key);
+        CREATE INDEX IF NOT EXISTS idx_urls_platform ON urls(platform_id, version_id);
+    """
+
+    def __init__(self, path: Optional[Path] = None) -> None:
+        """
+        Args:
+            path: 数据库文件，默认为HISTORY_DB_PATH
+        """
+        self.path = path or HISTORY_DB_PATH
+        self.conn = sqlite3.connect(self.path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("PRAGMA foreign_keys=ON")
+        self.conn.executescript(self.SCHEMA)
+        self._platform_ids: Dict[str, int] = dict(
+            (name, platform_id) for platform_id, name in self.conn.execute("SELECT id, name FROM platforms"))
+
+    def exists(self) -> bool:
+        """数据库中是否已有版本"""
+        return self.conn.execute("SELECT 1 FROM versions LIMIT 1").fetchone() is not None
+
+    @property
+    def location(self) -> Path:
+        """用于日志的存储位置"""
+        return self.path
+
+    @property
+    def latest_version(self) -> Optional[str]:
+        """最新版本"""
+        row = self.conn.execute("SELECT version FROM versions ORDER BY sort_key DESC LIMIT 1").fetchone()
+        return row[0] if row else None
+
+    def __len__(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM versions").fetchone()[0]
+
+    def __contains__(self, version: object) -> bool:
+        return isinstance(version, str) and self.conn.execute(
+            "SELECT 1 FROM versions WHERE version = ?", (version,)).fetchone() is not None
+
+    def get(self, version: str) -> Optional[VersionHistoryEntry]:
+        """按版本号查找条目"""
+        return next(self._query_entries("WHERE v.version = ?", (version,)), None)
+
+    def upsert(self, entry: VersionHistoryEntry) -> bool:
+        """
+        插入或替换条目，修改在调用save()时提交
+
+        Returns:
+            是否为新版本
+        """
+        row = self.conn.execute("SELECT id FROM versions WHERE version = ?", (entry["version"],)).fetchone()
+        if row is not None and json.dumps(self.get(entry["version"])) == json.dumps(entry):
+            return False
+        if row is None:
+            version_id = self.conn.execute(
+                "INSERT INTO versions (version, sort_key, date, series) VALUES (?, ?, ?, ?)",
+                (entry["version"], parse_version(entry["version"]).sort_token, entry["date"],
+                 version_series(entry["version"]))).lastrowid
+        else:
+            version_id = row[0]
+            self.conn.execute("UPDATE versions SET date = ? WHERE id = ?", (entry["date"], version_id))
+            self.conn.execute("DELETE FROM urls WHERE version_id = ?", (version_id,))
+        self.conn.executemany(
+            "INSERT INTO urls (version_id, platform_id, position, url) VALUES (?, ?, ?, ?)",
+            [(version_id, self._platform_id(platform), position, url)
+             for position, (platform, url) in enumerate(entry["platforms"].items())])
+        return row is None
+
+    def iter_recent(self, limit: Optional[int] = None) -> Iterator[VersionHistoryEntry]:
+        """按最新的在前的顺序迭代条目"""
+        return self._query_entries("", (), limit)
+
+    def to_history(self) -> VersionHistory:
+        """组装成完整的版本历史对象"""
+        return {"versions": list(self.iter_recent())}
+
+    def series_summary(self) -> List[Dict[str, Any]]:
+        """各系列的版本数和最新版本（最新的系列在前），计数和最新版本都只读取series索引"""
+        rows = self.conn.execute("""
+            SELECT s.series, s.count,
+                   (SELECT version FROM versions WHERE series = s.series ORDER BY sort_key DESC LIMIT 1)
+            FROM (SELECT series, COUNT(*) AS count FROM versions GROUP BY series) s
+        """)
+        summary = [{"series": series, "count": count, "latest": latest} for series, count, latest in rows]
+        return sorted(summary, key=lambda item: series_key(item["series"]), reverse=True)
+
+    def iter_series(self, series: str) -> Iterator[VersionHistoryEntry]:
+        """按最新的在前的顺序迭代一个系列的条目，通过series索引查询"""
+        return self._query_entries("WHERE v.series = ?", (series,))
+
+    def latest_build_before(self, platform: str, date: str) -> Optional[VersionHistoryEntry]:
+        """
+        查找指定日期之前发布、包含该平台的最新版本（按版本号比较）
+
+        Args:
+            platform: 平台名称，如 'linux-arm64'
+            date: YYYY-MM-DD 格式的日期（不含当天）
+
+        Returns:
+            找到的条目，没有则返回None
+        """
+        platform_id = self._platform_ids.get(platform)
+        if platform_id is None:
+            return None
+        return next(self._query_entries(
+            "WHERE v.date < ? AND EXISTS (SELECT 1 FROM urls WHERE version_id = v.id AND platform_id = ?)",
+            (date, platform_id), 1), None)
+
+    def import_history(self, history: VersionHistory) -> None:
+        """
+        用给定的完整历史替换数据库内容，在一个事务中批量写入
+
+        Args:
+            history: 完整的版本历史对象，重复的版本只保留第一次出现的条目
+        """
+        entries: Dict[str, VersionHistoryEntry] = {}
+        for entry in history["versions"]:
+            entries.setdefault(entry["version"], entry)
+
+        with self.conn:
+            self.conn.execute("DELETE FROM urls")
+            self.conn.execute("DELETE FROM versions")
+            self.conn.executemany(
+                "INSERT INTO versions (id, version, sort_key, date, series) VALUES (?, ?, ?, ?, ?)",
+                [(version_id, entry["version"], parse_version(entry["version"]).sort_token, entry["date"],
+                  version_series(entry["version"]))
+                 for version_id, entry in enumerate(entries.values(), 1)])
+            self.conn.executemany(
+                "INSERT INTO urls (version_id, platform_id, position, url) VALUES (?, ?, ?, ?)",
+                [(version_id, self._platform_id(platform), position, url)
+                 for version_id, entry in enumerate(entries.values(), 1)
+                 for position, (platform, url) in enumerate(entry["platforms"].items())])
+
+    def save(self) -> None:
+        """提交未保存的修改"""
+        self.conn.commit()
+
+    def close(self) -> None:
+        """提交修改并关闭数据库连接"""
+        self.conn.commit()
+        self.conn.close()
+
+    def _platform_id(self, platform: str) -> int:
+        platform_id = self._platform_ids.get(platform)
+        if platform_id is None:
+            platform_id = self.conn.execute("INSERT INTO platforms (name) VALUES (?)", (platform,)).lastrowid
+            self._platform_ids[platform] = platform_id
+        return platform_id
+
+    def _query_entries(self, where: str, params: Tuple[Any, ...],
+                       limit: Optional[int] = None) -> Iterator[VersionHistoryEntry]:
+        """按条件查询条目（最新的在前），一次连接查询取出版本和所有平台URL"""
+        limit_clause = "LIMIT ?" if limit is not None else ""
+        rows = self.conn.execute(f"""
+            SELECT v.version, v.date, p.name, u.url
+            FROM (SELECT * FROM versions v {where} ORDER BY v.sort_key DESC {limit_clause}) v
+            LEFT JOIN urls u ON u.version_id = v.id
+            LEFT JOIN platforms p ON p.id = u.platform_id
+            ORDER BY v.sort_key DESC, u.position
+        """, params + ((limit,) if limit is not None else ()))
+
+        entry: Optional[VersionHistoryEntry] = None
+        for version, date, platform, url in rows:
+            if entry is None or entry["version"] != version:
+                if entry is not None:
+                    yield entry
+                entry = {"version": version, "date": date, "platforms": {}}
+            if platform is not None:
+                entry["platforms"][platform] = url
+        if entry is not None:
+            yield entry
+
+# 两种存储后端提供相同的接口
+HistoryStore = Union[ShardedHistoryStore, SqliteHistoryStore]
+
+# 本次运行中已打开的版本历史存储，按后端和位置复用，由close_history_stores()统一关闭
+_history_stores: Dict[Tuple[str, Path], HistoryStore] = {}
+
+# 打开版本历史存储
+def open_history_store(backend: Optional[str] = None) -> HistoryStore:
+    """
+    打开版本历史存储，同一次运行中对同一后端和位置返回同一个实例
+
+    JSON后端：分片尚未初始化但存在旧版version-history.json时自动迁移。
+    SQLite后端：数据库为空时自动从JSON历史批量导入。
+
+    Args:
+        backend: "json" 或 "sqlite"，默认为HISTORY_BACKEND（环境变量CURSOR_HISTORY_BACKEND）
+
+    Returns:
+        ShardedHistoryStore 或 SqliteHistoryStore
+    """
+    backend = backend or HISTORY_BACKEND
+    if backend not in ("json", "sqlite"):
+        raise ValueError(f'未知的版本历史存储后端: {backend}')
+    location = (HISTORY_DB_PATH if backend == "sqlite" else Path.cwd() / HISTORY_DIR_NAME).resolve()
+    store = _history_stores.get((backend, location))
+    if store is None:
+        store = _history_stores[(backend, location)] = _create_history_store(backend)
+    return store
+
+# 关闭本次运行中打开的所有版本历史存储
+def close_history_stores() -> None:
+    """关闭并清空已打开的存储，SQLite后端在关闭前提交修改"""
+    while _history_stores:
+        _, store = _history_stores.popitem()
+        store.close()
+
+# 创建版本历史存储实例
+def _create_history_store(backend: str) -> HistoryStore:
+    if backend == "sqlite":
+        db_store = SqliteHistoryStore()
+        if not db_store.exists():
+            json_history = open_history_store("json").to_history()
+            if json_history["versions"]:
+                logger.info(f'将JSON版本历史批量导入 {db_store.path}')
+                db_store.import_history(json_history)
+                logger.info(f'导入完成，共 {len(db_store)} 个版本')
+        return db_store
+
+    store = ShardedHistoryStore()
+    legacy_path = Path.cwd() / LEGACY_HISTORY_FILE_NAME
+    if not store.exists() and legacy_path.exists():
+        logger.info(f'将 {LEGACY_HISTORY_FILE_NAME} 迁移到分片存储 {HISTORY_DIR_NAME}/')
+        with open(legacy_path, 'r', encoding='utf-8') as f:
+            store.import_history(json.load(f))
+        logger.info(f'迁移完成，共 {len(store)} 个版本，{len(store.shards)} 个分片；{LEGACY_HISTORY_FILE_NAME} 已不再使用')
+    return store
+
+# 读取完整的版本历史
 def read_version_history() -> VersionHistory:
     """
-    读取version-history.json文件，如果不存在则返回空历史
+    读取所有分片组装完整的版本历史，如果不存在则返回空历史
 
     Returns:
         版本历史对象
     """
-    history_path = Path.cwd() / "version-history.json"
-    if history_path.exists():
-        try:
-            with open(history_path, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except Exception as error:
-            logger.error(f'读取版本历史时出错: {error}')
-            return {"versions": []}
-    else:
-        logger.warning('未找到version-history.json，将创建新文件')
+    try:
+        store = open_history_store()
+        if not store.exists():
+            logger.warning(f'未找到版本历史 {store.location}，将创建新的版本历史')
+        return store.to_history()
+    except Exception as error:
+        logger.error(f'读取版本历史时出错: {error}')
         return {"versions": []}
 
-# 保存版本历史到JSON文件
+# 保存完整的版本历史
 def save_version_history(history: VersionHistory) -> None:
     """
-    将版本历史保存到version-history.json文件
+    将完整的版本历史保存到分片存储
 
     Args:
         history: 要保存的版本历史对象
@@ -216,90 +2219,511 @@ def save_version_history(history: VersionHistory) -> None:
         logger.error('提供的版本历史对象无效')
         return
 
-    history_path = Path.cwd() / "version-history.json"
+    try:
+        open_history_store().import_history(history)
+    except Exception as error:
+        logger.error(f'保存版本历史时出错: {error}')
+        raise  # 重新抛出以允许调用者处理
 
-    # 保留备份
-    if history_path.exists():
-        try:
-            backup_path = Path(f"{history_path}.backup")
-            history_path.replace(backup_path)
-        except Exception as error:
-            logger.warning(f'创建版本历史备份失败: {error}')
+# 探测规范平台的最新版本
+async def probe_latest_version(session: CursorApiSession) -> Optional[VersionInfo]:
+    """
+    只请求探测平台，提取其最新版本
 
-    try:
-        json_data = json.dumps(history, indent=2)
+    Args:
+        session: 共享的API会话
 
-        # 在写入文件前验证JSON有效性
-        try:
-            json.loads(json_data)
-        except Exception as parse_error:
-            logger.error(f'生成了无效的JSON数据，中止保存: {parse_error}')
+    Returns:
+        探测平台的下载URL和版本，请求失败或无法提取版本时返回None
+    """
+    url = await fetch_latest_download_url(PROBE_PLATFORM, session)
+    if not url:
+        return None
+    with tracer.span("extract_version", platform=PROBE_PLATFORM):
+        version = extract_version(url)
+    if version == 'Unknown':
+        logger.warning(f"无法从探测平台 {PROBE_PLATFORM} 的URL中提取版本: {url}")
+        return None
+    return {"url": url, "version": version}
+
+# README版本表格的表头
+README_TABLE_HEADER = ("| Version | Date | Mac Installer | Windows Installer | Linux Installer |\n"
+                       "| --- | --- | --- | --- | --- |")
+
+# README中由脚本生成的区域：版本表格、历史版本索引和"脚本最后更新"时间
+README_TABLE_REGION = "version-table"
+README_INDEX_REGION = "history-index"
+README_STAMP_REGION = "last-updated"
+
+# 各系列历史版本页面所在的目录
+HISTORY_PAGES_DIR = Path("docs") / "history"
+
+class ReadmeRegionError(Exception):
+    """README中的生成区域标记缺失或不成对"""
+
+# 定位README中由标记包围的生成区域
+def find_regions(content: str, required: Iterable[str] = ()) -> Dict[str, Tuple[int, int]]:
+    """
+    一次线性扫描找出所有 <!-- BEGIN:name --> ... <!-- END:name --> 区域
+
+    只使用str.find逐个查找注释开头，没有正则回溯，开销与文件大小成正比。
+
+    Args:
+        content: README内容
+        required: 必须存在的区域名称
+
+    Returns:
+        区域名称 -> 两个标记之间内容的起止偏移
+
+    Raises:
+        ReadmeRegionError: 标记缺失、重复、嵌套或不成对
+    """
+    regions: Dict[str, Tuple[int, int]] = {}
+    open_name: Optional[str] = None
+    open_end = 0
+    position = content.find('<!-- ')
+    while position != -1:
+        close = content.find(' -->', position)
+        if close == -1:
+            break
+        marker = content[position + 5:close]
+        if marker.startswith('BEGIN:'):
+            if open_name is not None:
+                raise ReadmeRegionError(f'区域 {open_name} 还没有结束就开始了区域 {marker[6:]}')
+            open_name, open_end = marker[6:], close + 4
+            if open_name in regions:
+                raise ReadmeRegionError(f'区域 {open_name} 重复出现')
+        elif marker.startswith('END:'):
+            if marker[4:] != open_name:
+                raise ReadmeRegionError(f'区域结束标记 {marker[4:]} 没有对应的开始标记')
+            regions[open_name] = (open_end, position)
+            open_name = None
+        position = content.find('<!-- ', close + 4)
+
+    if open_name is not None:
+        raise ReadmeRegionError(f'区域 {open_name} 缺少结束标记 <!-- END:{open_name} -->')
+    missing = [name for name in required if name not in regions]
+    if missing:
+        raise ReadmeRegionError(f'缺少区域标记: {", ".join(f"<!-- BEGIN:{name} -->" for name in missing)}')
+    return regions
+
+# 替换生成区域的内容
+def splice_regions(content: str, regions: Dict[str, Tuple[int, int]], replacements: Dict[str, str]) -> str:
+    """
+    按偏移一次拼接出新内容，区域以外的部分原样保留
+
+    Args:
+        content: README内容
+        regions: find_regions的结果
+        replacements: 区域名称 -> 新的区域内容，未列出的区域保持不变
+
+    Returns:
+        新的README内容
+    """
+    parts: List[str] = []
+    previous_end = 0
+    for name, (start, end) in sorted(regions.items(), key=lambda item: item[1]):
+        if name in replacements:
+            parts.append(content[previous_end:start])
+            parts.append(replacements[name])
+            previous_end = end
+    parts.append(content[previous_end:])
+    return ''.join(parts)
+
+# 生成一个版本的表格行
+def render_table_row(entry: VersionHistoryEntry) -> str:
+    """
+    Args:
+        entry: 版本历史条目
+
+    Returns:
+        Markdown表格行
+    """
+    platforms_data = entry["platforms"]
+    links: Dict[str, List[str]] = {}
+    for os_key, platform_list in PLATFORMS.items():
+        links[os_key] = [f"[{platform}]({platforms_data[platform]})"
+                         for platform in platform_list["platforms"] if platform in platforms_data]
+
+    mac_links = '<br>'.join(links["mac"])
+    windows_links = '<br>'.join(links["windows"])
+    linux_links = '<br>'.join(links["linux"]) or 'Not Ready'
+    return f"| {entry['version']} | {entry['date']} | {mac_links} | {windows_links} | {linux_links} |"
+
+# 表格行格式的版本，修改render_table_row的输出格式时递增，使已缓存的行失效
+RENDERED_ROW_FORMAT = 1
+
+# 渲染行缓存最多保存的行数
+RENDERED_ROW_CACHE_LIMIT = 1000
+
+class RenderedRowCache:
+    """
+    已渲染表格行的缓存，按条目内容（版本、日期和各平台URL）的哈希索引
+
+    历史条目在发布后基本不会再变化，只有新增或修改过的条目需要重新渲染。
+    缓存按最近使用的顺序保存，超过RENDERED_ROW_CACHE_LIMIT时丢弃最久未使用的行。
+    只有新增或丢弃了行时才需要写回磁盘，全部命中的运行不会重写缓存文件。
+    """
+
+    def __init__(self, path: Optional[Path] = None) -> None:
+        self.reset(path)
+
+    def reset(self, path: Optional[Path] = None) -> None:
+        """清空缓存和上一次运行的计数"""
+        self.path = path or Path.cwd() / STATE_DIR_NAME / "rendered-rows.json"
+        self.rows: Dict[str, str] = {}
+        self.hits = 0
+        self.misses = 0
+        self._dirty = False
+
+    def load(self, path: Optional[Path] = None) -> "RenderedRowCache":
+        """从磁盘（重新）加载缓存，文件不存在、损坏或格式版本不同时从空缓存开始"""
+        self.reset(path)
+        if self.path.exists():
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                if isinstance(data, dict) and data.get("format") == RENDERED_ROW_FORMAT:
+                    self.rows = data.get("rows", {})
+                    self._evict()
+            except Exception as error:
+                logger.warning(f'读取渲染行缓存失败，将忽略缓存: {error}')
+        return self
+
+    @staticmethod
+    def key(entry: VersionHistoryEntry) -> str:
+        """条目内容的哈希"""
+        content = json.dumps([entry["version"], entry["date"], list(entry["platforms"].items())])
+        return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+    def render(self, entry: VersionHistoryEntry) -> str:
+        """返回条目的表格行，缓存中没有时渲染并缓存"""
+        key = self.key(entry)
+        row = self.rows.pop(key, None)
+        # 重新插入到末尾，保持最近使用的顺序（命中只改变内存中的顺序，下次写回时一并保存）
+        if row is None:
+            self.misses += 1
+            row = self.rows[key] = render_table_row(entry)
+            self._dirty = True
+            self._evict()
+        else:
+            self.hits += 1
+            self.rows[key] = row
+        return row
+
+    def save(self) -> None:
+        """将缓存写回磁盘（仅在有变化时）"""
+        if not self._dirty:
+            return
+        data = json.dumps({"format": RENDERED_ROW_FORMAT, "rows": self.rows}, ensure_ascii=False)
+        if write_state_file(self.path, data, '渲染行缓存'):
+            self._dirty = False
+
+    def _evict(self) -> None:
+        """丢弃超过RENDERED_ROW_CACHE_LIMIT的最久未使用的行"""
+        excess = len(self.rows) - RENDERED_ROW_CACHE_LIMIT
+        if excess <= 0:
             return
+        for key in list(self.rows)[:excess]:
+            del self.rows[key]
+        self._dirty = True
 
-        # 先写入临时文件，然后重命名以避免部分写入
-        temp_path = Path(f"{history_path}.tmp")
-        with open(temp_path, 'w', encoding='utf-8') as f:
-            f.write(json_data)
-        temp_path.replace(history_path)
+    def log_stats(self) -> None:
+        """输出缓存命中和重新渲染的行数"""
+        logger.info(f"表格行缓存: 命中 {self.hits} 行，渲染 {self.misses} 行")
 
-        # 写入后验证文件是否存在
-        if not history_path.exists():
-            logger.error('保存版本历史失败：写入后文件不存在')
-    except Exception as error:
-        logger.error(f'保存版本历史时出错: {error}')
-        raise  # 重新抛出以允许调用者处理
+# 全局渲染行缓存，main中从状态目录加载并在运行结束时保存
+rendered_rows = RenderedRowCache()
+
+# 将一个条目增量合并到表格行中
+def patch_table_rows(rows: Iterable[str], entry: VersionHistoryEntry, limit: int) -> Iterator[str]:
+    """
+    逐行合并：替换该版本已有的行，或按版本顺序插入一行，超出窗口的旧行不再输出；
+    只渲染这一个条目，开销与版本历史的长度无关
+
+    Args:
+        rows: 现有的表格行（最新的在前），可以是生成器
+        entry: 新增或更新的条目
+        limit: 表格最多保留的行数
+
+    Yields:
+        新的表格行
+    """
+    new_row = rendered_rows.render(entry)
+    new_key = version_key(entry["version"])
+    emitted = 0
+    inserted = False
+    for row in rows:
+        if emitted >= limit:
+            return
+        if not inserted:
+            row_version = row.split('|', 2)[1].strip()
+            if row_version == entry["version"]:
+                inserted = True
+                emitted += 1
+                yield new_row
+                continue
+            if version_key(row_version) < new_key:
+                inserted = True
+                emitted += 1
+                yield new_row
+                if emitted >= limit:
+                    return
+        emitted += 1
+        yield row
+    if not inserted and emitted < limit:
+        yield new_row
+
+# 生成"脚本最后更新"区域的内容
+def render_stamp() -> str:
+    """使用东八区时间"""
+    return f"脚本最后更新: `{get_utc8_time().strftime('%Y-%m-%d %H:%M:%S')}`"
+
+# 取出表格区域中的数据行
+def table_rows_of(lines: Iterable[str]) -> Iterator[str]:
+    """跳过表头、分隔行和空行，按原顺序返回表格数据行"""
+    table_lines = 0
+    for line in lines:
+        if line.startswith('|'):
+            table_lines += 1
+            # 前两行是表头和分隔行
+            if table_lines > 2:
+                yield line
+
+# 生成版本表格区域的内容
+def table_block(rows: Callable[[Iterator[str]], Iterable[str]]) -> Callable[[Iterator[str]], Iterator[str]]:
+    """
+    Args:
+        rows: 接收旧表格行（不含表头）的迭代器，返回新的表格行
+
+    Returns:
+        stream_readme使用的区域变换函数
+    """
+    def block(lines: Iterator[str]) -> Iterator[str]:
+        yield ""
+        yield README_TABLE_HEADER
+        yield from rows(table_rows_of(lines))
+        yield ""
+    return block
+
+# 生成历史版本索引区域的内容
+def history_index_lines(store: "HistoryStore") -> Iterator[str]:
+    """每个 major.minor 系列一行，链接到该系列的历史版本页面"""
+    yield ""
+    yield "| Series | Versions | Latest |"
+    yield "| --- | --- | --- |"
+    for summary in store.series_summary():
+        page = f"{HISTORY_PAGES_DIR.as_posix()}/{summary['series']}.md"
+        yield f"| [{summary['series']}]({page}) | {summary['count']} | {summary['latest']} |"
+    yield ""
+
+# 流式改写README
+def stream_readme(readme_path: Path,
+                  blocks: Dict[str, Callable[[Iterator[str]], Iterable[str]]],
+                  stamp: Optional[str] = None,
+                  dry_run: bool = False) -> bool:
+    """
+    逐行复制README到临时文件：生成区域以外的内容原样复制，每个区域的新内容由对应的变换函数
+    从旧内容流式生成后直接写入，最后原子替换。内存占用与表格行数无关。
+
+    多行区域（版本表格、历史索引）的开始和结束标记必须各占一行；"脚本最后更新"区域在行内替换。
+    标记有误时抛出ReadmeRegionError，临时文件被删除，README保持不变。
+
+    Args:
+        readme_path: README文件
+        blocks: 区域名称 -> 变换函数，接收区域中旧的各行（不含换行符），返回新的各行
+        stamp: "脚本最后更新"区域的新内容，为None时保持不变
+        dry_run: 只计算不写入，用于预先校验标记和判断内容是否会变化
+
+    Returns:
+        dry_run时返回内容是否会变化，否则返回是否实际写入了文件
+
+    Raises:
+        ReadmeRegionError: 生成区域标记缺失、重复或不成对
+    """
+    block_names = {f"<!-- BEGIN:{name} -->": name for name in blocks}
+    input_hasher = hashlib.sha256()
+    output_hasher = hashlib.sha256()
+    output_bytes = 0
+    seen_regions: set = set()
+    temp_path = Path(f"{readme_path}.tmp")
+
+    with open(readme_path, 'r', encoding='utf-8', newline='') as src, \
+            (io.StringIO() if dry_run else open(temp_path, 'w', encoding='utf-8', newline='')) as dst:
+
+        def read_lines() -> Iterator[str]:
+            for source_line in src:
+                if dry_run:
+                    input_hasher.update(source_line.encode('utf-8'))
+                yield source_line
+
+        def write(text: str) -> None:
+            nonlocal output_bytes
+            data = text.encode('utf-8')
+            output_hasher.update(data)
+            output_bytes += len(data)
+            if not dry_run:
+                dst.write(text)
+
+        try:
+            lines = read_lines()
+            for line in lines:
+                name = block_names.get(line.strip())
+                if name is not None:
+                    if name in seen_regions:
+                        raise ReadmeRegionError(f'区域 {name} 重复出现')
+                    seen_regions.add(name)
+                    block_end = f"<!-- END:{name} -->"
+                    end_line: Optional[str] = None
+
+                    def old_lines() -> Iterator[str]:
+                        nonlocal end_line
+                        for block_line in lines:
+                            if block_line.strip() == block_end:
+                                end_line = block_line
+                                return
+                            if '<!-- ' in block_line:
+                                raise ReadmeRegionError(f'区域 {name} 中出现了其他标记')
+                            yield block_line.rstrip('\r\n')
+
+                    write(line)
+                    existing_lines = old_lines()
+                    for new_line in blocks[name](existing_lines):
+                        write(new_line + "\n")
+                    # 变换函数可能没有读完旧的内容（例如超出窗口的表格行），跳过剩余部分直到结束标记
+                    for _ in existing_lines:
+                        pass
+                    if end_line is None:
+                        raise ReadmeRegionError(f'区域 {name} 缺少结束标记 {block_end}')
+                    write(end_line)
+                    continue
+
+                regions = find_regions(line)
+                for region in regions:
+                    if region in blocks:
+                        raise ReadmeRegionError(f'区域 {region} 的开始和结束标记必须各自单独占一行')
+                    if region in seen_regions:
+                        raise ReadmeRegionError(f'区域 {region} 重复出现')
+                if README_STAMP_REGION in regions and stamp is not None:
+                    line = splice_regions(line, regions, {README_STAMP_REGION: stamp})
+                seen_regions.update(regions)
+                write(line)
+
+            missing = [name for name in (*blocks, README_STAMP_REGION) if name not in seen_regions]
+            if missing:
+                raise ReadmeRegionError(f'缺少区域标记: {", ".join(f"<!-- BEGIN:{name} -->" for name in missing)}')
+        except BaseException:
+            if not dry_run:
+                dst.close()
+                temp_path.unlink(missing_ok=True)
+            raise
+
+    if dry_run:
+        return output_hasher.digest() != input_hasher.digest()
+
+    digest = output_hasher.hexdigest()
+    if content_hashes.unchanged(readme_path, digest):
+        temp_path.unlink()
+        return False
+    temp_path.replace(readme_path)
+    content_hashes.record(readme_path, digest)
+    metrics.readme_bytes_written += output_bytes
+    return True
+
+# 生成一个系列的历史版本页面
+def write_series_page(store: "HistoryStore", series: str) -> bool:
+    """
+    将一个 major.minor 系列的全部版本写入 docs/history/<series>.md，内容未变化时跳过
+
+    Args:
+        store: 版本历史存储
+        series: 系列名称，如 '3.15'
+
+    Returns:
+        是否实际写入了文件
+    """
+    page_path = Path.cwd() / HISTORY_PAGES_DIR / f"{series}.md"
+    page_path.parent.mkdir(parents=True, exist_ok=True)
+    lines = [f"# Cursor {series} 历史版本", "", "[返回 README](../../README.md)", "", README_TABLE_HEADER]
+    lines.extend(rendered_rows.render(entry) for entry in store.iter_series(series))
+    return write_file_if_changed(page_path, ("\n".join(lines) + "\n").encode('utf-8'))
 
 # 使用最新的Cursor链接更新README.md文件
-async def update_readme(force_update=False) -> bool:
+async def update_readme(force_update=False,
+                        max_concurrency: int = DEFAULT_FETCH_CONCURRENCY,
+                        session: Optional[CursorApiSession] = None,
+                        probe: bool = True,
+                        stamp_unchanged: bool = True) -> bool:
     """
     获取最新的Cursor下载链接并更新README.md文件
 
     Args:
         force_update: 是否强制更新，即使版本已存在
+        max_concurrency: 并发请求平台下载链接的最大数量
+        session: 共享的API会话，未提供时在本次调用内创建并在结束时报告连接池统计
+        probe: 是否先只探测一个平台，版本已知时跳过其余平台的请求
+        stamp_unchanged: 表格没有变化时是否仍然更新"脚本最后更新"时间
 
     Returns:
         更新是否成功
     """
+    if session is None:
+        async with CursorApiSession() as own_session:
+            try:
+                return await update_readme(force_update, max_concurrency, own_session, probe, stamp_unchanged)
+            finally:
+                own_session.log_pool_stats()
+
     # 使用东八区时间
     current_time = get_utc8_time()
     logger.info(f"开始更新检查 - {current_time.isoformat()}")
 
     # 收集所有URL和版本
-    results: Dict[str, Dict[str, VersionInfo]] = {}
-    latest_version = '0.0.0'
+    latest_parsed: Optional[Version] = None
     current_date = format_date(current_time)
 
-    # 获取所有平台下载URL
-    for os_key, os_data in PLATFORMS.items():
-        results[os_key] = {}
-
-        for platform in os_data["platforms"]:
-            url = await fetch_latest_download_url(platform)
-
-            if url:
-                version = extract_version(url)
-                results[os_key][platform] = {"url": url, "version": version}
-
-                # 跟踪最高版本号
-                if version != 'Unknown' and version > latest_version:
-                    latest_version = version
-
-    if latest_version == '0.0.0':
+    # 探测模式：先只请求一个平台，版本已知则直接结束
+    prefetched: Dict[str, str] = {}
+    if probe and not force_update:
+        probe_info = await probe_latest_version(session)
+        if probe_info:
+            # 只读取manifest和探测版本所在的分片
+            store = open_history_store()
+            metrics.history_entries = len(store)
+            if probe_info["version"] in store:
+                logger.info(f"探测到的版本 {probe_info['version']} 已存在于版本历史中，跳过其余平台的请求")
+                return False
+            logger.info(f"探测到未知版本 {probe_info['version']}，开始获取所有平台")
+            prefetched[PROBE_PLATFORM] = probe_info["url"]
+
+    # 并发获取所有平台下载URL
+    results = await fetch_all_platforms(max_concurrency, session, prefetched)
+
+    for os_results in results.values():
+        for info in os_results.values():
+            version = info["version"]
+            # 跟踪最高版本号
+            parsed = parse_version(version)
+            if parsed.is_valid and (latest_parsed is None or parsed > latest_parsed):
+                latest_parsed = parsed
+
+    if latest_parsed is None:
         logger.error('未能检索到任何有效的版本信息')
         return False
 
+    latest_version = latest_parsed.text
     logger.info(f"检测到最新版本: {latest_version}")
 
-    # 使用version-history.json作为版本检查的唯一真实来源
-    history = read_version_history()
-
-    # 检查此版本是否已存在于版本历史中
-    existing_version_index = next((i for i, entry in enumerate(history["versions"])
-                                  if entry["version"] == latest_version), -1)
+    # 使用分片存储的版本历史作为版本检查的唯一真实来源
+    with tracer.span("history_read") as span:
+        store = open_history_store()
+        # 检查此版本是否已存在于版本历史中（只加载该版本所在的分片）
+        existing_entry = store.get(latest_version)
+        span["entries"] = metrics.history_entries = len(store)
 
     # 如果版本已存在且不是强制更新，则退出
-    if existing_version_index != -1 and not force_update:
-        logger.info(f"版本 {latest_version} 已存在于版本历史中，无需更新 README 和 version-history.json")
+    if existing_entry is not None and not force_update:
+        logger.info(f"版本 {latest_version} 已存在于版本历史中，无需更新 README 和版本历史")
         return False
 
     # 读取README
@@ -308,9 +2732,6 @@ async def update_readme(force_update=False) -> bool:
         logger.error('未找到README.md文件')
         return False
 
-    with open(readme_path, 'r', encoding='utf-8') as f:
-        readme_content = f.read()
-
     # 为历史条目创建新的平台对象
     platforms: Dict[str, str] = {}
 
@@ -327,131 +2748,184 @@ async def update_readme(force_update=False) -> bool:
         "platforms": platforms
     }
 
-    # 如果版本已存在，则更新现有条目，否则添加新条目
-    if existing_version_index != -1:
-        logger.info(f"更新版本历史中的版本 {latest_version}")
-        history["versions"][existing_version_index] = new_entry
-    else:
-        logger.info(f"将新版本 {latest_version} 添加到version-history.json")
-        history["versions"].append(new_entry)
-
-    # 按版本排序（最新的在前）
-    history["versions"].sort(key=lambda x: version_key(x["version"]), reverse=True)
-
-    # 删除重复的版本
-    unique_versions = {}
-    unique_history = []
-    duplicates_count = 0
-    for entry in history["versions"]:
-        version = entry["version"]
-        if version not in unique_versions:
-            unique_versions[version] = True
-            unique_history.append(entry)
-        else:
-            duplicates_count += 1
+    # 增量更新README：只渲染新条目这一行，插入到表格中对应的位置；历史索引根据manifest重新生成
+    def patch_rows(rows: Iterator[str]) -> Iterator[str]:
+        return patch_table_rows(rows, new_entry, README_TABLE_ROWS)
 
-    if duplicates_count > 0:
-        logger.info(f"删除了 {duplicates_count} 个重复版本")
+    blocks = {
+        README_TABLE_REGION: table_block(patch_rows),
+        README_INDEX_REGION: lambda _: history_index_lines(store),
+    }
 
-    history["versions"] = unique_history
+    # 在修改版本历史之前确认README的生成区域完好（标记有误时不写入任何内容），同时判断表格是否会变化
+    try:
+        with tracer.span("readme_check") as span:
+            span["changed"] = table_changed = stream_readme(readme_path, blocks, dry_run=True)
+    except ReadmeRegionError as error:
+        logger.error(f'README.md的生成区域标记有误，未进行更新: {error}')
+        return False
 
-    # 将历史大小限制为100个条目，以防止无限增长
-    if len(history["versions"]) > 100:
-        history["versions"] = history["versions"][:100]
-        logger.info("将版本历史截断为100个条目")
+    # 如果版本已存在，则更新现有条目，否则添加新条目
+    if existing_entry is not None:
+        logger.info(f"更新版本历史中的版本 {latest_version}")
+    else:
+        logger.info(f"将新版本 {latest_version} 添加到版本历史")
+    # 条目在插入时已保持有序（最新的在前），只有该版本所在的分片会被修改
+    store.upsert(new_entry)
+    metrics.history_entries = len(store)
 
-    # 重要：在更新README之前保存更新的历史JSON
+    # 重要：在更新README之前保存更新的历史分片
     try:
-        save_version_history(history)
-        logger.info(f"已更新 version-history.json 文件")
+        with tracer.span("history_save", entries=len(store)):
+            store.save()
+        logger.info(f"已将版本 {latest_version} 保存到版本历史")
     except Exception as error:
         logger.error(f'保存版本历史时出错: {error}')
         # 即使版本历史保存失败，也继续进行README更新
 
-    # 生成平台链接
-    def generate_platform_links(os_key, results):
-        """生成指定操作系统的平台下载链接HTML"""
-        links = []
-        if os_key in results:
-            for platform in PLATFORMS[os_key]["platforms"]:
-                if platform in results[os_key] and results[os_key][platform]["url"]:
-                    links.append(f"[{platform}]({results[os_key][platform]['url']})")
-        return '<br>'.join(links) if links else ('Not Ready' if os_key == 'linux' else '')
-
-    # 生成各平台链接
-    mac_links = generate_platform_links('mac', results)
-    windows_links = generate_platform_links('windows', results)
-    linux_links = generate_platform_links('linux', results) or 'Not Ready'
-
-    # 从version-history.json生成完整的表格
-    table_rows = []
+    # 只重写新版本所在系列的页面
+    series = version_series(latest_version)
+    with tracer.span("page_write", series=series) as span:
+        span["written"] = write_series_page(store, series)
 
-    # 遍历所有版本，生成表格行
-    for entry in history["versions"]:
-        version = entry["version"]
-        date = entry["date"]
-        platforms_data = entry["platforms"]
-
-        # 生成各平台链接
-        mac_urls = []
-        win_urls = []
-        linux_urls = []
-
-        for os_key, platform_list in PLATFORMS.items():
-            for platform in platform_list["platforms"]:
-                if platform in platforms_data:
-                    link = f"[{platform}]({platforms_data[platform]})"
-                    if os_key == 'mac':
-                        mac_urls.append(link)
-                    elif os_key == 'windows':
-                        win_urls.append(link)
-                    elif os_key == 'linux':
-                        linux_urls.append(link)
-
-        mac_links = '<br>'.join(mac_urls) if mac_urls else ''
-        windows_links = '<br>'.join(win_urls) if win_urls else ''
-        linux_links = '<br>'.join(linux_urls) if linux_urls else 'Not Ready'
-
-        # 生成表格行
-        row = f"| {version} | {date} | {mac_links} | {windows_links} | {linux_links} |"
-        table_rows.append(row)
-
-    # 构建完整的表格
-    table_header = "| Version | Date | Mac Installer | Windows Installer | Linux Installer |\n| --- | --- | --- | --- | --- |"
-    table_content = table_header + "\n" + "\n".join(table_rows)
-
-    # 替换README中的表格
-    table_pattern = re.compile(r"\| Version \| Date \| Mac Installer \| Windows Installer \| Linux Installer \|\s*\n\|\s*---\s*\|\s*---\s*\|\s*---\s*\|\s*---\s*\|\s*---\s*\|(.*?)(?=\n\n|\Z)", re.DOTALL)
-    readme_content = table_pattern.sub(table_content, readme_content)
-
-    # 如果没有找到表格，则在文件末尾添加
-    if not table_pattern.search(readme_content):
-        readme_content += f"\n\n{table_content}\n"
-
-    # 保存更新的README
+    # 保存更新的README；可选择在表格没有变化时保留原时间，避免无意义的提交
     try:
-        # 更新"脚本最后更新"时间，使用东八区时间
-        current_time_str = get_utc8_time().strftime('%Y-%m-%d %H:%M:%S')
-        readme_content = re.sub(r'脚本最后更新: `[^`]*`', f'脚本最后更新: `{current_time_str}`', readme_content)
-
-        with open(readme_path, 'w', encoding='utf-8') as f:
-            f.write(readme_content)
-        logger.info(f"README.md已更新为包含最新Cursor版本")
+        stamp = render_stamp() if stamp_unchanged or table_changed else None
+        with tracer.span("readme_write", mode="patch") as span:
+            span["written"] = written = stream_readme(readme_path, blocks, stamp)
+        if written:
+            logger.info(f"README.md已更新为包含最新Cursor版本")
     except Exception as error:
         logger.error(f'保存README时出错: {error}')
         return False
 
     return True
 
+# 根据版本历史完整重建README表格（修复模式）
+def rebuild_readme(stamp_unchanged: bool = True) -> bool:
+    """
+    不请求网络，用版本历史中最近的README_TABLE_ROWS个版本重新生成README表格和历史索引，
+    并重新生成各系列的历史版本页面，用于README与版本历史不一致时的修复
+
+    Args:
+        stamp_unchanged: 表格没有变化时是否仍然更新"脚本最后更新"时间
+
+    Returns:
+        是否写入了README
+    """
+    readme_path = Path.cwd() / "README.md"
+    if not readme_path.exists():
+        logger.error('未找到README.md文件')
+        return False
+
+    store = open_history_store()
+
+    # 忽略旧的表格行，按版本历史逐行生成
+    def history_rows(_: Iterator[str]) -> Iterator[str]:
+        return (rendered_rows.render(entry) for entry in store.iter_recent(README_TABLE_ROWS))
+
+    blocks = {
+        README_TABLE_REGION: table_block(history_rows),
+        README_INDEX_REGION: lambda _: history_index_lines(store),
+    }
+
+    with tracer.span("page_write", mode="rebuild") as span:
+        span["written"] = pages_written = sum(write_series_page(store, summary["series"])
+                                              for summary in store.series_summary())
+    if pages_written:
+        logger.info(f'已重写 {pages_written} 个系列的历史版本页面')
+
+    try:
+        table_changed = stream_readme(readme_path, blocks, dry_run=True)
+        stamp = render_stamp() if stamp_unchanged or table_changed else None
+        with tracer.span("readme_write", mode="rebuild"):
+            written = stream_readme(readme_path, blocks, stamp)
+    except ReadmeRegionError as error:
+        logger.error(f'README.md的生成区域标记有误，无法重建: {error}')
+        return False
+
+    logger.info('已根据版本历史重建README表格' if written else 'README表格与版本历史一致，无需重建')
+    return written
+
+# 创建共享会话并运行一次更新检查
+async def run_update(force_update: bool = False,
+                     probe: bool = True,
+                     deadline_seconds: Optional[float] = DEFAULT_RUN_DEADLINE,
+                     retry_policy: Optional[RetryPolicy] = None,
+                     hedge_policy: Optional[HedgePolicy] = None,
+                     timeout: float = DEFAULT_REQUEST_TIMEOUT,
+                     max_concurrency: int = DEFAULT_FETCH_CONCURRENCY,
+                     stamp_unchanged: bool = True) -> bool:
+    """
+    整个运行共享一个连接池，运行结束后输出并保存请求统计和内容哈希记录
+
+    Returns:
+        是否找到并写入了新版本
+    """
+    response_cache = ResponseCache.load()
+    latency_histogram = LatencyHistogram.load()
+    async with CursorApiSession(timeout=timeout,
+                                cache=response_cache,
+                                retry_policy=retry_policy,
+                                deadline=RunDeadline(deadline_seconds),
+                                hedge_policy=hedge_policy,
+                                latency=latency_histogram) as session:
+        updated = await update_readme(force_update=force_update,
+                                      max_concurrency=max_concurrency,
+                                      session=session,
+                                      probe=probe,
+                                      stamp_unchanged=stamp_unchanged)
+    session.log_fetch_stats()
+    session.log_pool_stats()
+    response_cache.save()
+    response_cache.log_stats()
+    latency_histogram.save()
+    content_hashes.log_stats()
+    content_hashes.save()
+    rendered_rows.log_stats()
+    rendered_rows.save()
+    metrics.rendered_row_hits = rendered_rows.hits
+    metrics.rendered_row_misses = rendered_rows.misses
+    return updated
+
 # 主函数，以适当的错误处理运行更新
-async def main() -> None:
-    """主函数，运行更新过程并处理错误"""
+async def main(force_update: bool = False,
+               probe: bool = True,
+               deadline_seconds: Optional[float] = DEFAULT_RUN_DEADLINE,
+               retry_policy: Optional[RetryPolicy] = None,
+               hedge_policy: Optional[HedgePolicy] = None,
+               timeout: float = DEFAULT_REQUEST_TIMEOUT,
+               max_concurrency: int = DEFAULT_FETCH_CONCURRENCY,
+               trace_path: Optional[Path] = None,
+               metrics_path: Optional[Path] = None,
+               stamp_unchanged: bool = True) -> None:
+    """
+    主函数，运行更新过程并处理错误
+
+    Args:
+        force_update: 是否强制更新，即使版本已存在
+        probe: 是否启用探测模式
+        deadline_seconds: 本次运行的时间预算（秒），为None时不限制
+        retry_policy: 请求重试策略，为None时使用默认策略
+        hedge_policy: 对冲请求策略，为None时不发送对冲请求
+        timeout: 单次请求超时时间（秒）
+        max_concurrency: 并发请求平台下载链接的最大数量
+        trace_path: 分阶段计时的JSON lines输出文件，为None时不记录
+        metrics_path: OpenMetrics指标输出文件，为None时不输出
+        stamp_unchanged: 表格没有变化时是否仍然更新README中的时间
+    """
+    start_time = time.time()
+    metrics.reset()
+    content_hashes.load()
+    rendered_rows.load()
     try:
-        start_time = time.time()
         logger.info(f"开始更新过程")
+        tracer.configure(trace_path)
 
         # 运行更新，默认不强制更新
-        updated = await update_readme(force_update=False)
+        with tracer.span("run", force_update=force_update, probe=probe):
+            updated = await run_update(force_update, probe, deadline_seconds, retry_policy,
+                                       hedge_policy, timeout, max_concurrency, stamp_unchanged)
         elapsed_time = int((time.time() - start_time) * 1000)
 
         if updated:
@@ -459,27 +2933,33 @@ async def main() -> None:
         else:
             logger.info(f"更新完成，耗时 {elapsed_time}ms。未找到新版本或版本已存在。")
 
+        metrics.new_version_found = updated
+
         # 在结束时验证文件完整性
-        verify_file_integrity()
+        with tracer.span("integrity_check"):
+            verify_file_integrity()
+        metrics.run_success = True
     except Exception as error:
         logger.critical(f'更新过程中出现严重错误: {error}', exc_info=True)
         # 如果进程以非零退出，任何GitHub Action都会将工作流标记为失败
         exit(1)
+    finally:
+        close_history_stores()
+        tracer.close()
+        if metrics_path is not None:
+            metrics.run_duration_seconds = time.time() - start_time
+            metrics.write(metrics_path)
 
 def verify_file_integrity():
-    """验证version-history.json和README.md的完整性和一致性"""
-    history_path = Path.cwd() / "version-history.json"
+    """验证版本历史分片和README.md的完整性和一致性"""
     readme_path = Path.cwd() / "README.md"
 
-    if not history_path.exists():
-        logger.warning('警告：更新后version-history.json不存在。这可能表明存在问题。')
-        return
-
     try:
-        # 验证JSON文件有效性
-        with open(history_path, 'r', encoding='utf-8') as f:
-            content = f.read()
-            history_json = json.loads(content)
+        # 验证manifest有效性
+        store = open_history_store()
+        if not store.exists():
+            logger.warning(f'警告：更新后版本历史 {store.location} 不存在。这可能表明存在问题。')
+            return
 
         if not readme_path.exists():
             logger.warning('README.md文件不存在，无法验证一致性。')
@@ -499,16 +2979,15 @@ def verify_file_integrity():
         latest_date_in_readme = version_match.group(2)
 
         # 检查此版本是否存在于历史中
-        version_exists = any(v["version"] == latest_version_in_readme for v in history_json["versions"])
-        if not version_exists:
-            logger.warning(f"警告：版本 {latest_version_in_readme} 在README.md中但不在version-history.json中")
-            sync_readme_to_history(readme_content, latest_version_in_readme, latest_date_in_readme, history_json)
+        if latest_version_in_readme not in store:
+            logger.warning(f"警告：版本 {latest_version_in_readme} 在README.md中但不在版本历史中")
+            sync_readme_to_history(readme_content, latest_version_in_readme, latest_date_in_readme, store)
     except Exception as err:
         logger.error(f'验证文件完整性时出错: {err}', exc_info=True)
 
-def sync_readme_to_history(readme_content, version, date, history_json):
-    """从README中提取版本信息并同步到version-history.json"""
-    logger.info(f"从README.md提取数据并更新version-history.json...")
+def sync_readme_to_history(readme_content, version, date, store):
+    """从README中提取版本信息并同步到版本历史分片"""
+    logger.info(f"从README.md提取数据并更新版本历史...")
 
     # 从README中提取此版本的URL
     section_regex = re.compile(f'\\| {version} \\| {date} \\| (.*?) \\| (.*?) \\| (.*?) \\|')
@@ -544,36 +3023,181 @@ def sync_readme_to_history(readme_content, version, date, history_json):
             "platforms": platforms
         }
 
-        history_json["versions"].append(new_entry)
-
-        # 排序并保存
-        history_json["versions"].sort(key=lambda x: x["version"], reverse=True)
+        # 按版本顺序插入到所属分片
+        store.upsert(new_entry)
 
         # 保存更新的历史
-        save_version_history(history_json)
+        store.save()
         logger.info(f"成功从README.md同步版本 {version}，包含 {platform_count} 个平台链接")
     else:
         logger.warning(f"无法提取版本 {version} 的平台链接")
 
 # 导出函数以进行测试
 __all__ = [
+    'CursorApiSession',
+    'ResponseCache',
+    'ContentHashIndex',
+    'RetryPolicy',
+    'RunDeadline',
+    'HedgePolicy',
+    'LatencyHistogram',
     'fetch_latest_download_url',
+    'fetch_all_platforms',
     'update_readme',
+    'rebuild_readme',
+    'render_table_row',
+    'RenderedRowCache',
+    'stream_readme',
+    'write_series_page',
+    'patch_table_rows',
+    'run_update',
+    'SpanTracer',
+    'tracer',
+    'RunMetrics',
+    'metrics',
+    'run_with_profile',
+    'run_with_memory_trace',
     'read_version_history',
     'save_version_history',
+    'ShardedHistoryStore',
+    'SqliteHistoryStore',
+    'open_history_store',
+    'close_history_stores',
+    'probe_latest_version',
     'extract_version',
+    'parse_download_url',
+    'encode_history_entry',
+    'decode_history_entry',
+    'parse_history_urls',
+    'benchmark_url_parser',
     'format_date',
     'version_key',
+    'HistoryIndex',
+    'Version',
+    'parse_version',
     'get_utc8_time',
     'main'
 ]
 
 # 运行更新
 if __name__ == "__main__":
-    import asyncio
+    import argparse
+
+    parser = argparse.ArgumentParser(description="更新Cursor历史版本下载链接")
+    parser.add_argument("--force", action="store_true", help="即使版本已存在也强制更新")
+    parser.add_argument("--no-probe", action="store_true", help="禁用探测模式，始终获取所有平台")
+    parser.add_argument("--no-stamp-unchanged", action="store_true",
+                        help="README表格没有变化时不更新\"脚本最后更新\"时间，内容相同的文件不会被重写")
+    parser.add_argument("--deadline", type=float, default=DEFAULT_RUN_DEADLINE,
+                        help="本次运行的时间预算（秒），重试不会超过该时间")
+    parser.add_argument("--retries", type=int, default=RetryPolicy.max_attempts,
+                        help="网络错误时每个平台的最大尝试次数")
+    parser.add_argument("--timeout", type=float, default=DEFAULT_REQUEST_TIMEOUT, help="单次请求超时时间（秒）")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_FETCH_CONCURRENCY, help="并发请求的最大数量")
+    parser.add_argument("--hedge", action="store_true", help="启用对冲请求，降低慢请求的尾延迟")
+    parser.add_argument("--hedge-percentile", type=float, default=HedgePolicy.percentile,
+                        help="发送对冲请求前等待的历史延迟百分位数")
+    parser.add_argument("--trace-spans", type=Path, metavar="PATH",
+                        help="将各阶段耗时以JSON lines格式追加写入到指定文件")
+    parser.add_argument("--metrics-file", type=Path, metavar="PATH",
+                        help="运行结束时将OpenMetrics格式的指标写入到指定文件（node-exporter textfile）")
+    parser.add_argument("--profile", type=Path, nargs="?", const=Path(STATE_DIR_NAME) / "update.pstats",
+                        metavar="PATH", help="在cProfile下运行并写出pstats文件（默认 .cache/update.pstats）")
+    parser.add_argument("--trace-memory", action="store_true",
+                        help="使用tracemalloc统计内存峰值和分配最多的代码位置")
+    parser.add_argument("--top", type=int, default=25, help="性能和内存分析中输出的条目数量")
+    parser.add_argument("--bench-url-parser", action="store_true",
+                        help="使用当前版本历史对下载URL解析器做微基准测试后退出")
+    parser.add_argument("--latency-report", action="store_true",
+                        help="输出各平台历史请求延迟的p50/p95/p99后退出")
+    parser.add_argument("--rebuild-readme", action="store_true",
+                        help="不请求网络，根据版本历史完整重建README表格后退出（修复模式）")
+    parser.add_argument("--compact-history", action="store_true",
+                        help="将版本历史日志合并到分片快照后退出")
+    parser.add_argument("--history-backend", choices=["json", "sqlite"], default=HISTORY_BACKEND,
+                        help="版本历史存储后端（默认取环境变量CURSOR_HISTORY_BACKEND，否则为json）")
+    parser.add_argument("--history-db", type=Path, default=HISTORY_DB_PATH, metavar="PATH",
+                        help="SQLite后端的数据库文件（默认取环境变量CURSOR_HISTORY_DB，否则为history.sqlite3）")
+    parser.add_argument("--import-history", action="store_true",
+                        help="将JSON版本历史批量导入SQLite数据库后退出")
+    parser.add_argument("--latest-build", metavar="PLATFORM",
+                        help="查询指定平台在--before日期之前的最新版本后退出")
+    parser.add_argument("--before", default=None, metavar="YYYY-MM-DD",
+                        help="与--latest-build一起使用，默认为明天（即包含今天）")
+    args = parser.parse_args()
+    HISTORY_BACKEND = args.history_backend
+    HISTORY_DB_PATH = args.history_db
+    content_hashes.load()
+    rendered_rows.load()
+
+    if args.bench_url_parser:
+        result = benchmark_url_parser(read_version_history())
+        close_history_stores()
+        print(f"URL数量: {result['urls']}，单个解析: {result['parse_ns_per_url']:.0f} ns/URL，"
+              f"批量解析: {result['batch_ns_per_url']:.0f} ns/URL")
+        exit(0)
+
+    if args.latency_report:
+        print(LatencyHistogram.load().report())
+        exit(0)
+
+    if args.rebuild_readme:
+        rebuild_readme(stamp_unchanged=not args.no_stamp_unchanged)
+        close_history_stores()
+        rendered_rows.log_stats()
+        rendered_rows.save()
+        content_hashes.save()
+        exit(0)
+
+    if args.compact_history:
+        store = open_history_store("json")
+        records = store.journal_records
+        store.compact()
+        close_history_stores()
+        content_hashes.save()
+        print(f"已将 {records} 条日志记录合并到 {len(store.shards)} 个分片，共 {len(store)} 个版本")
+        exit(0)
+
+    if args.import_history:
+        db_store = SqliteHistoryStore()
+        import_start = time.perf_counter()
+        db_store.import_history(open_history_store("json").to_history())
+        print(f"已导入 {len(db_store)} 个版本到 {db_store.path}，耗时 {(time.perf_counter() - import_start) * 1000:.0f}ms")
+        db_store.close()
+        close_history_stores()
+        exit(0)
+
+    if args.latest_build:
+        before = args.before or format_date(get_utc8_time() + timedelta(days=1))
+        entry = open_history_store().latest_build_before(args.latest_build, before)
+        close_history_stores()
+        if entry is None:
+            print(f"{before} 之前没有 {args.latest_build} 的版本")
+            exit(1)
+        print(f"{entry['version']} ({entry['date']}): {entry['platforms'][args.latest_build]}")
+        exit(0)
+
+    def run() -> None:
+        asyncio.run(main(force_update=args.force,
+                         probe=not args.no_probe,
+                         deadline_seconds=args.deadline,
+                         retry_policy=RetryPolicy(max_attempts=args.retries),
+                         hedge_policy=HedgePolicy(enabled=args.hedge, percentile=args.hedge_percentile),
+                         timeout=args.timeout,
+                         max_concurrency=args.concurrency,
+                         trace_path=args.trace_spans,
+                         metrics_path=args.metrics_file,
+                         stamp_unchanged=not args.no_stamp_unchanged))
+
+    runner: Callable[[], None] = run
+    if args.trace_memory:
+        runner = lambda: run_with_memory_trace(run, args.top)
+    if args.profile:
+        profiled = runner
+        runner = lambda: run_with_profile(profiled, args.profile, args.top)
 
     try:
-        asyncio.run(main())
+        runner()
     except Exception as error:
         logger.critical(f'未处理的错误: {error}', exc_info=True)
         exit(1)
\ No newline at end of file